@@ -0,0 +1,307 @@
+# Async facade over db.py so handlers never block the event loop on disk I/O
+import asyncio
+import concurrent.futures
+import os
+import queue
+import threading
+from collections import Counter
+from typing import List, Dict, Any, Optional
+import db
+
+DB_QUEUE_SIZE = int(os.getenv("DB_QUEUE_SIZE", "256"))
+INGEST_FLUSH_MS = int(os.getenv("INGEST_FLUSH_MS", "250"))
+INGEST_FLUSH_ROWS = int(os.getenv("INGEST_FLUSH_ROWS", "200"))
+INGEST_MAX_ATTEMPTS = int(os.getenv("INGEST_MAX_ATTEMPTS", "3"))  # flushes a failing row gets before it is dropped
+
+_jobs = queue.Queue()
+_worker = None
+_worker_lock = threading.Lock()
+_queue_slots = None
+
+# Write-behind buffer for incoming chat messages (only touched from the event loop)
+_pending = []  # (row, future for its messages.id or None, failed attempts)
+_unflushed = Counter()  # channel_id -> rows queued or mid-flush
+_flush_lock = asyncio.Lock()
+_flush_wakeup = asyncio.Event()
+_flusher_task = None
+
+def _worker_loop():
+    while True:
+        job = _jobs.get()
+        if job is None:
+            break
+        fn, args, kwargs, future = job
+        if not future.set_running_or_notify_cancel():
+            continue
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+
+def _ensure_worker():
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_worker_loop, name="db-executor", daemon=True)
+            _worker.start()
+
+async def run(fn, *args, **kwargs):
+    """
+    Runs a blocking db function on the dedicated DB thread and awaits its result.
+    At most DB_QUEUE_SIZE calls may be queued; further callers wait here (on the
+    event loop, without blocking it) until a slot frees up.
+    """
+    global _queue_slots
+    if _queue_slots is None:
+        _queue_slots = asyncio.Semaphore(DB_QUEUE_SIZE)
+    _ensure_worker()
+    async with _queue_slots:
+        future = concurrent.futures.Future()
+        _jobs.put((fn, args, kwargs, future))
+        return await asyncio.wrap_future(future)
+
+def shutdown():
+    # Let queued jobs drain, then stop the DB thread
+    global _worker
+    with _worker_lock:
+        if _worker is not None and _worker.is_alive():
+            _jobs.put(None)
+            _worker.join()
+        _worker = None
+
+async def queue_message(channel_id: int, role: str, username: str, content: str,
+                        message_id: int | None = None, author_id: int | None = None, created_at: str | None = None):
+    """
+    Buffers a message for the next group commit instead of writing it right away.
+    The buffer is flushed every INGEST_FLUSH_MS or as soon as it holds
+    INGEST_FLUSH_ROWS rows, whichever comes first. Pass the Discord message_id
+    so a later /import_history recognises the message as already stored.
+    """
+    _enqueue((channel_id, role, username, content, message_id, author_id, created_at), None)
+
+async def store_message(channel_id: int, role: str, username: str, content: str,
+                        message_id: int | None = None, author_id: int | None = None,
+                        created_at: str | None = None) -> int | None:
+    """
+    Like queue_message, but flushes right away and returns the stored row's
+    messages.id (None if it was already stored or couldn't be written).
+    """
+    stored = asyncio.get_running_loop().create_future()
+    _enqueue((channel_id, role, username, content, message_id, author_id, created_at), stored)
+    _flush_wakeup.set()
+    return await stored
+
+def _enqueue(row: tuple, stored):
+    global _flusher_task
+    _pending.append((row, stored, 0))
+    _unflushed[row[0]] += 1
+    if _flusher_task is None or _flusher_task.done():
+        _flusher_task = asyncio.create_task(_flusher())
+    if len(_pending) >= INGEST_FLUSH_ROWS:
+        _flush_wakeup.set()
+
+async def _flusher():
+    while True:
+        try:
+            await asyncio.wait_for(_flush_wakeup.wait(), INGEST_FLUSH_MS / 1000)
+        except asyncio.TimeoutError:
+            pass
+        _flush_wakeup.clear()
+        try:
+            await flush_messages()
+        except Exception as e:
+            print("Error flushing queued messages:", e)
+
+async def _store_rows(batch) -> list:
+    """
+    Writes a batch in one transaction; if that fails, row by row so one bad
+    row can't hold up the rest. Returns (entry, row id) for stored rows and
+    the entries that failed on their own.
+    """
+    try:
+        ids = await run(db.add_messages, [row for row, _, _ in batch])
+        return list(zip(batch, ids)), []
+    except Exception as e:
+        if len(batch) == 1:
+            print(f"Error storing a message for channel {batch[0][0][0]}:", e)
+            return [], batch
+        print("Error flushing queued messages, retrying one at a time:", e)
+    stored, failed = [], []
+    for entry in batch:
+        try:
+            stored.append((entry, (await run(db.add_messages, [entry[0]]))[0]))
+        except Exception as e:
+            print(f"Error storing a message for channel {entry[0][0]}:", e)
+            failed.append(entry)
+    return stored, failed
+
+async def flush_messages():
+    async with _flush_lock:
+        if not _pending:
+            return
+        batch = _pending[:]
+        _pending.clear()
+        try:
+            stored, failed = await _store_rows(batch)
+        except BaseException:
+            # Cancelled mid-flush: keep the rows so the next flush retries them
+            _pending[:0] = batch
+            raise
+        # Failing rows are retried by the next flushes, then dropped so they can't block their channel forever
+        retry = [(row, future, attempts + 1) for row, future, attempts in failed if attempts + 1 < INGEST_MAX_ATTEMPTS]
+        dropped = [entry for entry in failed if entry[2] + 1 >= INGEST_MAX_ATTEMPTS]
+        _pending[:0] = retry
+        for row, _, _ in dropped:
+            print(f"Dropping a message for channel {row[0]} after {INGEST_MAX_ATTEMPTS} failed writes")
+        _unflushed.subtract(row[0] for (row, _, _), _ in stored)
+        _unflushed.subtract(row[0] for row, _, _ in dropped)
+        for channel_id in [c for c, n in _unflushed.items() if n <= 0]:
+            del _unflushed[channel_id]
+        for (_, future, _), row_id in stored:
+            if future is not None and not future.done():
+                future.set_result(row_id)
+        for _, future, _ in dropped:
+            if future is not None and not future.done():
+                future.set_result(None)
+
+async def _read_your_writes(channel_id: int):
+    # Reads for a channel with buffered (or mid-flush) messages wait for them to land
+    if _unflushed.get(channel_id):
+        await flush_messages()
+
+async def close():
+    """
+    Flushes buffered messages and stops the DB thread. Call once on shutdown.
+    """
+    global _flusher_task
+    if _flusher_task is not None:
+        _flusher_task.cancel()
+        _flusher_task = None
+    await flush_messages()
+    await asyncio.to_thread(shutdown)
+
+async def add_message(channel_id: int, role: str, username: str, content: str):
+    return await run(db.add_message, channel_id, role, username, content)
+
+async def get_history(channel_id: int, limit: int = 1000, after_id: int = 0,
+                      up_to_id: int | None = None) -> List[Dict[str, Any]]:
+    await _read_your_writes(channel_id)
+    return await run(db.get_history, channel_id, limit, after_id, up_to_id)
+
+async def search_history(channel_id: int, query: str, limit: int = 10) -> List[Dict[str, Any]]:
+    await _read_your_writes(channel_id)
+    return await run(db.search_history, channel_id, query, limit)
+
+async def get_last_imported_message_id(channel_id: int) -> int:
+    return await run(db.get_last_imported_message_id, channel_id)
+
+async def set_last_imported_message_id(channel_id: int, message_id: int):
+    return await run(db.set_last_imported_message_id, channel_id, message_id)
+
+async def import_messages(channel_id: int, rows: List[tuple], last_message_id: int) -> int:
+    return await run(db.import_messages, channel_id, rows, last_message_id)
+
+async def get_messages_after_user_last(channel_id: int, username: str) -> List[Dict[str, Any]]:
+    await _read_your_writes(channel_id)
+    return await run(db.get_messages_after_user_last, channel_id, username)
+
+async def message_count(channel_id: int, days: int | str) -> int:
+    await _read_your_writes(channel_id)
+    return await run(db.message_count, channel_id, days)
+
+async def get_messages_for_timeframe(channel_id: int, timeframe: str) -> List[Dict[str, Any]]:
+    # The whole window in one list; prefer stream_messages_for_timeframe for long windows
+    return [msg async for chunk in stream_messages_for_timeframe(channel_id, timeframe) for msg in chunk]
+
+async def stream_messages_for_timeframe(channel_id: int, timeframe: str, chunk_size: int = 500):
+    """
+    Async generator over the timeframe's messages (including archived ones) in
+    chunks of at most `chunk_size`, oldest first: each chunk is fetched on the
+    DB thread only when the consumer asks for it.
+    """
+    bounds = db.timeframe_bounds(timeframe)
+    if bounds is None:
+        return
+    async for chunk in stream_messages_between(channel_id, bounds[0], bounds[1], chunk_size):
+        yield chunk
+
+async def stream_messages_between(channel_id: int, start: str | None, end: str | None, chunk_size: int = 500):
+    # Same, for explicit [start, end) UTC bounds. Archived rows are always older than the hot ones, so they go first
+    await _read_your_writes(channel_id)
+    for archived in (True, False):
+        after = None
+        while True:
+            chunk, after = await run(db.get_message_chunk, channel_id, start, end, after, chunk_size, archived)
+            if chunk:
+                yield chunk
+            if len(chunk) < chunk_size:
+                break
+
+async def add_recommendation(title: str):
+    return await run(db.add_recommendation, title)
+
+async def mark_recommendation_watched(title: str, username: str):
+    return await run(db.mark_recommendation_watched, title, username)
+
+async def get_recommendations_with_watchers() -> list[dict]:
+    return await run(db.get_recommendations_with_watchers)
+
+async def add_quote(channel_id: int, message_id: int, username: str, content: str, quoted_by: str):
+    return await run(db.add_quote, channel_id, message_id, username, content, quoted_by)
+
+async def get_quotes(channel_id: Optional[int] = None, limit: int = 10):
+    return await run(db.get_quotes, channel_id, limit)
+
+async def set_channel_personality(channel_id: int, personality: str):
+    return await run(db.set_channel_personality, channel_id, personality)
+
+async def get_channel_personality(channel_id: int) -> str | None:
+    # A fresh cache answers without a trip to the DB thread
+    if db.personality_cache_fresh():
+        return db.get_channel_personality(channel_id)
+    return await run(db.get_channel_personality, channel_id)
+
+async def get_user_ath(user_id: int):
+    return await run(db.get_user_ath, user_id)
+
+async def set_user_ath(user_id: int, username: str, timestamp: str):
+    return await run(db.set_user_ath, user_id, username, timestamp)
+
+async def record_reactions(rows: List[tuple]):
+    return await run(db.record_reactions, rows)
+
+async def remove_reaction(message_id: int, reactor_id: int, emoji: str):
+    return await run(db.remove_reaction, message_id, reactor_id, emoji)
+
+async def clear_reactions(message_id: int, emoji: str | None = None):
+    return await run(db.clear_reactions, message_id, emoji)
+
+async def get_message_author(message_id: int):
+    return await run(db.get_message_author, message_id)
+
+async def mark_reaction_backfill_done(channel_id: int):
+    return await run(db.mark_reaction_backfill_done, channel_id)
+
+async def reaction_backfill_done(channel_id: int) -> bool:
+    return await run(db.reaction_backfill_done, channel_id)
+
+async def reaction_summary(channel_id: int, start: str | None = None, end: str | None = None) -> Dict[str, Any]:
+    return await run(db.reaction_summary, channel_id, start, end)
+
+async def active_usernames(channel_id: int, start: str | None = None, end: str | None = None) -> set[str]:
+    await _read_your_writes(channel_id)
+    return await run(db.active_usernames, channel_id, start, end)
+
+async def get_reaction_checkpoint(channel_id: int) -> Dict[str, Any] | None:
+    return await run(db.get_reaction_checkpoint, channel_id)
+
+async def save_reaction_scan(channel_id: int, counts: Dict[tuple, int], low_bucket: str, scanned_up_to_id: int | None,
+                             includes_reactors: bool, replace_from: str | None = None, reset: bool = False):
+    return await run(db.save_reaction_scan, channel_id, counts, low_bucket, scanned_up_to_id,
+                     includes_reactors, replace_from, reset)
+
+async def reaction_scan_totals(channel_id: int, start: str | None = None, end: str | None = None) -> List[tuple]:
+    return await run(db.reaction_scan_totals, channel_id, start, end)
+
+async def count_messages() -> int:
+    return await run(db.count_messages)
@@ -1,6 +1,12 @@
 import discord
 from discord.ext import commands
 import os
+import adb
+import daily_summaries
+import keep_warm
+import llm_scheduler
+import ollama_client
+import retention
 from dev import add_dev_commands
 from sports.f1 import add_f1_command
 from finance import add_finance_commands
@@ -21,9 +27,24 @@ HISTORY_LIMIT = 1000  # Number of messages to keep per channel
 DEVELOPMENT_SERVER_ID = os.getenv('DEVELOPMENT_SERVER_ID')
 PRODUCTION_SERVER_ID = os.getenv('PRODUCTION_SERVER_ID')
 
+class GroupChatBot(commands.Bot):
+    async def setup_hook(self):
+        retention.start_retention()
+        daily_summaries.start_daily_summaries(OLLAMA_URL)
+
+    async def close(self):
+        # Flush buffered chat messages before the connection goes away
+        try:
+            await adb.close()
+        except Exception as e:
+            print("Error flushing database on shutdown:", e)
+        llm_scheduler.close()
+        await ollama_client.close()
+        await super().close()
+
 intents = discord.Intents.default()
 intents.message_content = True
-bot = commands.Bot(command_prefix="/", intents=intents)
+bot = GroupChatBot(command_prefix="/", intents=intents)
 
 add_f1_command(bot)
 add_dev_commands(bot)
@@ -42,6 +63,8 @@ add_recommendations_command(bot)
 @bot.event
 async def on_ready():
     #print(f'Logged in as {bot.user}')
+    # Load the model now so the first /chat doesn't wait for it
+    keep_warm.start_keep_warm(OLLAMA_URL)
     try:
         # Always sync to the development server for fast iteration,
         # but also sync globally if PRODUCTION_SERVER_ID is set.
@@ -0,0 +1,117 @@
+# Per-channel chat sessions for /chat and mentions: one append-only prompt per channel,
+# so Ollama's prompt cache covers everything up to the newest turn
+import asyncio
+import os
+from collections import OrderedDict
+import adb
+from llm_stream import scheduled_reply
+from ollama_client import ERROR_PREFIX, OLLAMA_MODEL
+from prompt import MESSAGE_OVERHEAD_TOKENS, fit_newest, message_tokens, prompt_budget, truncate
+
+CHAT_HISTORY_MESSAGES = int(os.getenv("CHAT_HISTORY_MESSAGES", "4"))  # channel messages offered as context per turn
+CHAT_SESSION_MAX_CHANNELS = int(os.getenv("CHAT_SESSION_MAX_CHANNELS", "64"))  # sessions kept in memory
+
+CHAT_GUARD = (
+    "Important: Use the conversation history only for context. "
+    "Answer ONLY the user's most recent message below. Do NOT repeat, summarize, or respond to earlier messages unless explicitly asked."
+)
+CONTEXT_HEADER = "Conversation history (context only):\n"
+
+class ChatSession:
+    """
+    The prompt of one channel's conversation with the bot: the system prompt,
+    then per turn the channel messages seen since the previous turn (as a
+    context block), the question and the reply. Turns are only ever appended,
+    so each request starts with the exact bytes of the one before it.
+    """
+    def __init__(self, system_prompt: str):
+        self.system_prompt = system_prompt
+        self.messages = [{"role": "system", "content": system_prompt + "\n\n" + CHAT_GUARD}]
+        self.tokens = message_tokens(self.messages[0])
+        self.last_id = 0  # newest messages.id already in the prompt
+
+    def append(self, message: dict):
+        self.messages.append(message)
+        self.tokens += message_tokens(message)
+
+    def compact(self, budget: int):
+        """
+        Drops the oldest turns until the prompt fits half the budget. This
+        changes the prefix once, after which turns hit the cache again, rather
+        than sliding the window (and missing the cache) on every turn.
+        """
+        keep = 1
+        tokens = self.tokens
+        while keep < len(self.messages) and tokens > budget // 2:
+            tokens -= message_tokens(self.messages[keep])
+            keep += 1
+        # Never start the conversation with a reply
+        while keep < len(self.messages) and self.messages[keep]["role"] == "assistant":
+            tokens -= message_tokens(self.messages[keep])
+            keep += 1
+        self.messages = self.messages[:1] + self.messages[keep:]
+        self.tokens = tokens
+
+_sessions = OrderedDict()  # channel_id -> ChatSession, least recently used first
+_locks = {}  # channel_id -> asyncio.Lock
+
+def history_line(msg: dict) -> str:
+    if msg.get("role") == "user":
+        return f"USER ({msg.get('username') or 'user'}): {msg.get('content') or ''}"
+    return f"ASSISTANT: {msg.get('content') or ''}"
+
+def _session(channel_id: int, system_prompt: str) -> ChatSession:
+    # A new personality starts a new conversation
+    session = _sessions.get(channel_id)
+    if session is None or session.system_prompt != system_prompt:
+        session = ChatSession(system_prompt)
+        _sessions[channel_id] = session
+    _sessions.move_to_end(channel_id)
+    while len(_sessions) > CHAT_SESSION_MAX_CHANNELS:
+        _sessions.popitem(last=False)
+    return session
+
+async def reply(channel_id: int, question_id: int | None, system_prompt: str, username: str, message: str,
+                ollama_url: str, target) -> str | None:
+    """
+    Answers `message`, stored in the channel history as row `question_id`, in
+    the channel's session and streams the reply to the target. Returns the
+    reply text, or None when there is nothing to store: the request was shed
+    or the reply is an error (the user has already seen it). Turns in one
+    channel run one at a time so every question sees the answers before it.
+    """
+    lock = _locks.setdefault(channel_id, asyncio.Lock())
+    async with lock:
+        session = _session(channel_id, system_prompt)
+        fresh = session.last_id == 0
+        context = []
+        if question_id is not None and question_id > session.last_id:
+            # Messages since the previous turn, up to (not including) this question. Anything
+            # stored while we waited for the lock is newer and is left for the next turn.
+            history = await adb.get_history(channel_id, limit=CHAT_HISTORY_MESSAGES + 1,
+                                            after_id=session.last_id, up_to_id=question_id)
+            # Earlier replies are already in the session as assistant turns
+            context = [msg for msg in history if msg["id"] != question_id and (fresh or msg["role"] != "assistant")]
+            context = context[-CHAT_HISTORY_MESSAGES:]
+
+        budget = prompt_budget(OLLAMA_MODEL)
+        current = {"role": "user", "content": f"{username}: {message}"}
+        current["content"] = truncate(current["content"], budget // 2)
+        turn = [current]
+        lines = fit_newest([history_line(msg) for msg in context], budget // 2 - message_tokens(current))
+        if lines:
+            turn.insert(0, {"role": "system", "content": CONTEXT_HEADER + "\n".join(lines) + "\n"})
+        turn_tokens = sum(message_tokens(msg) for msg in turn) + MESSAGE_OVERHEAD_TOKENS  # + the reply's header
+        if session.tokens + turn_tokens > budget:
+            session.compact(budget - turn_tokens)
+
+        response = await scheduled_reply(session.messages + turn, ollama_url, channel_id, target)
+        if response is None or ERROR_PREFIX in response:
+            # Shed or failed: leave the session as it was, the question never got an answer
+            return None
+        for msg in turn:
+            session.append(msg)
+        session.append({"role": "assistant", "content": response})
+        if question_id is not None:
+            session.last_id = max(session.last_id, question_id)
+        return response
@@ -0,0 +1,112 @@
+# Parallel channel history crawler: splits a time range into snowflake-bounded
+# segments, fetches them concurrently and hands the messages back as they arrive or in order
+import asyncio
+import math
+import os
+from datetime import datetime, timezone
+import discord
+
+CRAWL_SEGMENTS = int(os.getenv("CRAWL_SEGMENTS", "4"))  # segments per crawl
+CRAWL_CONCURRENCY = int(os.getenv("CRAWL_CONCURRENCY", "4"))  # page fetches in flight, bot-wide
+CRAWL_MIN_SEGMENT_DAYS = float(os.getenv("CRAWL_MIN_SEGMENT_DAYS", "1"))
+CRAWL_BUFFER_MESSAGES = int(os.getenv("CRAWL_BUFFER_MESSAGES", "1000"))  # fetched ahead of the consumer
+PAGE_SIZE = 100  # messages per history API call
+
+_page_slots = None
+
+def _limiter() -> asyncio.Semaphore:
+    # Shared by every crawl so concurrent commands don't multiply the request rate
+    global _page_slots
+    if _page_slots is None:
+        _page_slots = asyncio.Semaphore(CRAWL_CONCURRENCY)
+    return _page_slots
+
+def _snowflake(bound) -> int | None:
+    # Snowflake for a datetime / discord.Object / Message / None
+    if bound is None:
+        return None
+    if isinstance(bound, datetime):
+        return discord.utils.time_snowflake(bound)
+    return bound.id
+
+def segment_bounds(channel, after=None, before=None, segments: int = CRAWL_SEGMENTS) -> list[tuple[int | None, int | None]]:
+    """
+    Splits (after, before) into at most `segments` consecutive (after_id, before_id)
+    ranges of equal duration, each at least CRAWL_MIN_SEGMENT_DAYS long. An open
+    start is bounded by the channel's creation time, an open end by now.
+    """
+    low = _snowflake(after)
+    high = _snowflake(before)
+    created_at = getattr(channel, "created_at", None)
+    start = discord.utils.snowflake_time(low) if low else created_at
+    end = discord.utils.snowflake_time(high) if high else datetime.now(timezone.utc)
+    if start is None or end <= start:
+        return [(low, high)]
+    span_days = (end - start).total_seconds() / 86400
+    count = max(1, min(segments, math.floor(span_days / CRAWL_MIN_SEGMENT_DAYS)))
+    step = (end - start) / count
+    edges = [discord.utils.time_snowflake(start + step * i) for i in range(1, count)]
+    # history(after=a, before=b) is exclusive at both ends, so each later segment starts one below its edge
+    lows = [low] + [edge - 1 for edge in edges]
+    highs = edges + [high]
+    return list(zip(lows, highs))
+
+async def _fetch_segment(channel, after_id, before_id, out: asyncio.Queue):
+    try:
+        history = channel.history(
+            limit=None,
+            oldest_first=True,
+            after=discord.Object(id=after_id) if after_id else None,
+            before=discord.Object(id=before_id) if before_id else None,
+        ).__aiter__()
+        fetched = 0
+        while True:
+            if fetched % PAGE_SIZE == 0:
+                # This step makes the next API call; take a slot for it
+                async with _limiter():
+                    msg = await history.__anext__()
+            else:
+                msg = await history.__anext__()
+            fetched += 1
+            await out.put(msg)
+    except StopAsyncIteration:
+        await out.put(None)
+    except Exception as e:
+        await out.put(e)
+
+async def crawl_history(channel, after=None, before=None, segments: int = CRAWL_SEGMENTS, ordered: bool = True):
+    """
+    Async iterator over channel messages in (after, before), like
+    channel.history(limit=None, oldest_first=True, ...). Segments are fetched
+    concurrently (CRAWL_CONCURRENCY page requests in flight across the bot).
+    With ordered=False messages come in arrival order from whichever segment
+    has them, at most CRAWL_BUFFER_MESSAGES ahead of the consumer. With
+    ordered=True they come oldest first: the segment being consumed buffers up
+    to CRAWL_BUFFER_MESSAGES, later segments buffer everything they fetch so
+    they never stall waiting for the ones before them.
+    """
+    bounds = segment_bounds(channel, after, before, segments)
+    if ordered:
+        queues = [asyncio.Queue(CRAWL_BUFFER_MESSAGES if i == 0 else 0) for i in range(len(bounds))]
+    else:
+        queues = [asyncio.Queue(CRAWL_BUFFER_MESSAGES)] * len(bounds)
+    tasks = [asyncio.create_task(_fetch_segment(channel, after_id, before_id, queue))
+             for (after_id, before_id), queue in zip(bounds, queues)]
+    try:
+        # Unordered, every segment shares one queue: read until each has finished
+        readers = queues if ordered else queues[:1]
+        remaining = 1 if ordered else len(bounds)
+        for queue in readers:
+            finished = 0
+            while finished < remaining:
+                item = await queue.get()
+                if item is None:
+                    finished += 1
+                    continue
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+    finally:
+        # Stop the fetchers if the consumer stopped early or a segment failed
+        for task in tasks:
+            task.cancel()
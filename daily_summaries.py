@@ -0,0 +1,164 @@
+# Rolling per-day channel summaries: written once a local day closes, reused by long summaries
+import asyncio
+import os
+from datetime import date, timedelta
+import adb
+import db
+import summarizer
+
+DAILY_SUMMARY_INTERVAL_SECONDS = int(os.getenv("DAILY_SUMMARY_INTERVAL_SECONDS", "3600"))
+DAILY_SUMMARY_BACKFILL_DAYS = int(os.getenv("DAILY_SUMMARY_BACKFILL_DAYS", "31"))  # 0 = only on demand
+# Days summarized per background pass across all channels, newest first; the rest wait for later passes or /summarize
+DAILY_SUMMARY_MAX_PER_PASS = int(os.getenv("DAILY_SUMMARY_MAX_PER_PASS", "3"))
+# New day summaries one /summarize may write, newest first; other days without one are condensed raw
+DAILY_SUMMARY_MAX_PER_COMMAND = int(os.getenv("DAILY_SUMMARY_MAX_PER_COMMAND", "7"))
+
+DAY_PROMPT = (
+    "Summarize this day of a group chat conversation. Keep who said what, decisions, "
+    "plans and memorable moments. 150 words or less."
+)
+
+_task = None
+
+async def summarize_day(channel_id: int, day: date, ollama_url: str) -> str | None:
+    """
+    Summarizes what people said (not the bot's replies) on one closed local
+    day, hot and archived, and stores it with the number of messages covered.
+    """
+    start, end = db.local_day_start_str(day), db.local_day_start_str(day + timedelta(days=1))
+    covered = 0
+
+    async def people(message_chunks):
+        nonlocal covered
+        async for chunk in message_chunks:
+            chunk = [msg for msg in chunk if msg["role"] == "user"]
+            covered += len(chunk)
+            if chunk:
+                yield chunk
+    condensed = await summarizer.condense(channel_id, people(adb.stream_messages_between(channel_id, start, end)), ollama_url)
+    if condensed is None:
+        return None
+    summary = await summarizer.summarize_text(channel_id, ollama_url, DAY_PROMPT, condensed[0])
+    await adb.run(db.save_daily_summary, channel_id, day.isoformat(), summary, covered)
+    return summary
+
+async def _stale_days(channel_id: int, first_day: date | None, last_day: date) -> tuple[dict, list[str]]:
+    # ({local_date: summary} still valid, [local_date needing a (new) summary]) for [first_day, last_day)
+    first = first_day.isoformat() if first_day else None
+    counts = await adb.run(db.daily_user_message_totals, channel_id, first, last_day.isoformat())
+    stored = await adb.run(db.get_daily_summaries, channel_id, first, last_day.isoformat())
+    summaries = {day: entry[0] for day, entry in stored.items() if counts.get(day) == entry[1]}
+    return summaries, sorted(day for day in counts if day not in summaries)
+
+async def day_summaries(channel_id: int, first_day: date | None, last_day: date, ollama_url: str,
+                        progress=None) -> tuple[list[tuple[str, str]], list[str]]:
+    """
+    (summaries, raw_days) for the days in [first_day, last_day) with messages:
+    the (local_date, summary) pairs that are stored and still valid, oldest
+    first, and the days that have none. Missing days inside the background
+    window (all of them when that is off) are summarized now and stored, one at
+    a time and at most DAILY_SUMMARY_MAX_PER_COMMAND, newest first.
+    """
+    summaries, missing = await _stale_days(channel_id, first_day, last_day)
+    if DAILY_SUMMARY_BACKFILL_DAYS > 0:
+        window_start = (last_day - timedelta(days=DAILY_SUMMARY_BACKFILL_DAYS)).isoformat()
+        candidates = [day for day in missing if day >= window_start]
+    else:
+        candidates = missing
+    done = 0
+    for day in sorted(candidates, reverse=True)[:DAILY_SUMMARY_MAX_PER_COMMAND]:
+        summary = await summarize_day(channel_id, date.fromisoformat(day), ollama_url)
+        if summary is not None:
+            summaries[day] = summary
+        done += 1
+        if progress is not None:
+            await progress(done)
+    return sorted(summaries.items()), [day for day in missing if day not in summaries]
+
+async def window_chunks(channel_id: int, summaries: list[tuple[str, str]], raw_days: list[str]):
+    """
+    Message chunks for summarizer.condense over the days of day_summaries,
+    oldest first: a stored summary stands in for its day, and each run of
+    consecutive raw days is streamed as one stretch of messages, so condense
+    packs many days into each prompt instead of making a call per day.
+    """
+    days = sorted(summaries + [(day, None) for day in raw_days])
+    run = []
+    for day, summary in days + [(None, None)]:  # the sentinel flushes the last run
+        if summary is None and day is not None:
+            run.append(day)
+            continue
+        if run:
+            start = db.local_day_start_str(date.fromisoformat(run[0]))
+            end = db.local_day_start_str(date.fromisoformat(run[-1]) + timedelta(days=1))
+            async for chunk in adb.stream_messages_between(channel_id, start, end):
+                yield chunk
+            run = []
+        if summary is not None:
+            yield as_messages([(day, summary)])
+
+def as_messages(summaries: list[tuple[str, str]]) -> list[dict]:
+    # Day summaries in the message shape summarizer.condense packs
+    return [{"role": "system", "username": f"Summary of {day}", "content": summary} for day, summary in summaries]
+
+async def with_day_summaries(channel_id: int, messages: list[dict]) -> list[dict]:
+    """
+    Replaces the messages of every complete closed day inside `messages` (each
+    with a UTC 'timestamp') by that day's stored summary, when the summary was
+    built from exactly those messages. The first (partial) day and today stay raw.
+    """
+    by_day = {}
+    for msg in messages:
+        by_day.setdefault(db.local_date_of(msg["timestamp"]).isoformat(), []).append(msg)
+    days = list(by_day)
+    closed = days[1:]
+    today = db.today_local().isoformat()
+    if closed and closed[-1] == today:
+        closed = closed[:-1]
+    if not closed:
+        return messages
+    stored = await adb.run(db.get_daily_summaries, channel_id, closed[0], today)
+    result = []
+    for day in days:
+        entry = stored.get(day)
+        if day in closed and entry and entry[1] == sum(msg["role"] == "user" for msg in by_day[day]):
+            result.extend(as_messages([(day, entry[0])]))
+        else:
+            result.extend(by_day[day])
+    return result
+
+async def run_daily_summaries_once(ollama_url: str) -> int:
+    """
+    Summarizes up to DAILY_SUMMARY_MAX_PER_PASS closed days from the last
+    DAILY_SUMMARY_BACKFILL_DAYS that need it, newest first and one at a time,
+    so a restart never floods the LLM queue. Returns days summarized.
+    """
+    today = db.today_local()
+    first_day = today - timedelta(days=DAILY_SUMMARY_BACKFILL_DAYS)
+    channel_ids = await adb.run(db.channels_with_messages_since, first_day.isoformat())
+    todo = []
+    for channel_id in channel_ids:
+        _, missing = await _stale_days(channel_id, first_day, today)
+        todo.extend((day, channel_id) for day in missing)
+    todo.sort(reverse=True)
+    done = 0
+    for day, channel_id in todo[:DAILY_SUMMARY_MAX_PER_PASS]:
+        if await summarize_day(channel_id, date.fromisoformat(day), ollama_url) is not None:
+            done += 1
+    return done
+
+async def _daily_summaries_loop(ollama_url: str):
+    while True:
+        try:
+            await run_daily_summaries_once(ollama_url)
+        except Exception as e:
+            print("Error writing daily summaries:", e)
+        await asyncio.sleep(DAILY_SUMMARY_INTERVAL_SECONDS)
+
+def start_daily_summaries(ollama_url: str):
+    # No-op when DAILY_SUMMARY_BACKFILL_DAYS or DAILY_SUMMARY_MAX_PER_PASS is 0; days are then summarized on demand only
+    global _task
+    if DAILY_SUMMARY_BACKFILL_DAYS <= 0 or DAILY_SUMMARY_MAX_PER_PASS <= 0:
+        return
+    if _task is None or _task.done():
+        _task = asyncio.create_task(_daily_summaries_loop(ollama_url))
@@ -1,110 +1,260 @@
-import sqlite3
-from contextlib import closing
-from typing import List, Dict, Any
 import os
+import re
+import threading
+import zlib
+from collections import Counter
+from datetime import date, datetime, time, timedelta, timezone
+from time import monotonic
+from typing import List, Dict, Any
+from db_pool import reader, writer
+from local_time import EASTERN, TIMESTAMP_FORMAT, local_date_of
+from migrations import migrate
 
-DB_PATH = os.getenv("DB_PATH", "data/history.db")
-
-# Ensure the messages table exists
-with sqlite3.connect(DB_PATH) as conn:
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS messages (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            channel_id INTEGER,
-            role TEXT,
-            username TEXT,
-            content TEXT,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    # Track last imported message per channel
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS import_state (
-            channel_id INTEGER PRIMARY KEY,
-            last_message_id INTEGER
-        )
-    ''')
-    # Track TV show recommendations
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS recommendations (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT NOT NULL UNIQUE
-        )
-    ''')
-    # Track which users have watched which recommendations
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS recommendations_watched (
-            recommendation_id INTEGER,
-            username TEXT,
-            PRIMARY KEY (recommendation_id, username),
-            FOREIGN KEY (recommendation_id) REFERENCES recommendations(id)
-        )
-    ''')
-    # Hall of Fame Quotes table
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS quotes (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            channel_id INTEGER,
-            message_id INTEGER,
-            username TEXT,
-            content TEXT,
-            quoted_by TEXT,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    # Channel personalities table
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS channel_personalities (
-            channel_id INTEGER PRIMARY KEY,
-            personality TEXT
-        )
-    ''')
-    # Track user all-time high (ATH) events
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS user_ath (
-            user_id INTEGER PRIMARY KEY,
-            username TEXT,
-            last_ath DATETIME
-        )
-    ''')
+# Seconds before the personality cache re-reads the table (0 = trust it forever).
+# Only needed when more than one process writes personalities.
+PERSONALITY_CACHE_TTL = float(os.getenv("PERSONALITY_CACHE_TTL", "0"))
+
+_personalities: Dict[int, str] = {}
+_personalities_loaded_at = None
+_personalities_lock = threading.Lock()
+
+# Create or upgrade the schema in place
+with writer() as conn:
+    migrate(conn)
+
+def today_local() -> date:
+    return datetime.now(EASTERN).date()
+
+def local_day_start_str(local_date: date) -> str:
+    # Midnight Eastern on local_date as a UTC string comparable with messages.timestamp
+    start_est = datetime.combine(local_date, time(hour=0, minute=0), tzinfo=EASTERN)
+    return start_est.astimezone(timezone.utc).strftime(TIMESTAMP_FORMAT)
+
+def _bump_daily_counts(conn, counts: Counter):
+    # counts: (channel_id, local_date iso, username) -> messages added
+    conn.executemany(
+        """
+        INSERT INTO message_counts_daily (channel_id, local_date, username, count) VALUES (?, ?, ?, ?)
+        ON CONFLICT (channel_id, local_date, username) DO UPDATE SET count = count + excluded.count
+        """,
+        [(channel_id, local_date, username, n) for (channel_id, local_date, username), n in counts.items()]
+    )
+
+def _remember_names(conn, names: List[tuple]):
+    # names: (user_id, name, seen) sightings; keeps the newest name per user
+    conn.executemany(
+        """
+        INSERT INTO user_names (user_id, name, seen) VALUES (?, ?, ?)
+        ON CONFLICT (user_id) DO UPDATE SET name = excluded.name, seen = excluded.seen
+        WHERE excluded.seen >= COALESCE(user_names.seen, '')
+        """,
+        [(user_id, name, seen) for user_id, name, seen in names if user_id is not None and name]
+    )
 
 def add_message(channel_id: int, role: str, username: str, content: str):
-    with sqlite3.connect(DB_PATH) as conn:
+    add_messages([(channel_id, role, username, content)])
+
+def _insert_messages(conn, rows: List[tuple]) -> List[int | None]:
+    """
+    Inserts (channel_id, role, username, content[, message_id, author_id, created_at])
+    rows with one executemany and bumps the per-day rollup for what was inserted.
+    Rows whose Discord message_id is already stored (hot or archived) are skipped,
+    so replays and re-imports are idempotent. created_at (UTC) becomes the row
+    timestamp when given, otherwise the current time is used. Returns the new
+    messages.id of every row, None for skipped ones.
+    """
+    now_str = datetime.now(timezone.utc).strftime(TIMESTAMP_FORMAT)
+    message_ids = [row[4] for row in rows if len(row) > 4 and row[4] is not None]
+    seen = set()
+    for i in range(0, len(message_ids), 500):
+        part = message_ids[i:i + 500]
+        marks = ",".join("?" * len(part))
+        for table in ("messages", "messages_archive"):
+            seen.update(r[0] for r in conn.execute(
+                f"SELECT message_id FROM {table} WHERE message_id IN ({marks})", part
+            ))
+    values = []
+    inserted = []  # index into rows of each value
+    for i, row in enumerate(rows):
+        channel_id, role, username, content = row[:4]
+        message_id, author_id, created_at = (tuple(row[4:7]) + (None, None, None))[:3]
+        if message_id is not None:
+            if message_id in seen:
+                continue
+            seen.add(message_id)
+        values.append((channel_id, role, username, content, created_at or now_str, message_id, author_id, created_at))
+        inserted.append(i)
+    ids = [None] * len(rows)
+    if not values:
+        return ids
+    conn.executemany(
+        """
+        INSERT INTO messages (channel_id, role, username, content, timestamp, message_id, author_id, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        values
+    )
+    # One writer, one transaction: AUTOINCREMENT handed out consecutive ids ending at the last one
+    last_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+    for offset, i in enumerate(inserted):
+        ids[i] = last_id - len(values) + 1 + offset
+    local_dates = {}
+    for value in values:
+        if value[4] not in local_dates:
+            local_dates[value[4]] = local_date_of(value[4]).isoformat()
+    _bump_daily_counts(conn, Counter((v[0], local_dates[v[4]], v[2]) for v in values))
+    _remember_names(conn, [(v[6], v[2], v[4]) for v in values if v[1] == 'user'])
+    return ids
+
+def add_messages(rows: List[tuple]) -> List[int | None]:
+    """
+    Inserts many message rows (see _insert_messages) in a single transaction,
+    together with their per-day rollup. Returns the new row ids (None = skipped).
+    """
+    with writer() as conn:
+        return _insert_messages(conn, rows)
+
+def import_messages(channel_id: int, rows: List[tuple], last_message_id: int) -> int:
+    """
+    Inserts one import batch and advances the channel's import checkpoint in the
+    same transaction, so a crash never loses or repeats more than one batch.
+    """
+    with writer() as conn:
+        inserted = sum(row_id is not None for row_id in _insert_messages(conn, rows))
         conn.execute(
-            "INSERT INTO messages (channel_id, role, username, content) VALUES (?, ?, ?, ?)",
-            (channel_id, role, username, content)
+            "INSERT OR REPLACE INTO import_state (channel_id, last_message_id) VALUES (?, ?)",
+            (channel_id, last_message_id)
         )
-        conn.commit()
+        return inserted
 
-def get_history(channel_id: int, limit: int = 1000) -> List[Dict[str, Any]]:
-    with sqlite3.connect(DB_PATH) as conn:
+def get_history(channel_id: int, limit: int = 1000, after_id: int = 0,
+                up_to_id: int | None = None) -> List[Dict[str, Any]]:
+    # The newest `limit` messages stored with after_id < id <= up_to_id. Newest by
+    # timestamp: imported history gets high ids for old messages.
+    with reader() as conn:
         cursor = conn.execute(
-            "SELECT role, username, content FROM messages WHERE channel_id = ? ORDER BY id DESC LIMIT ?",
-            (channel_id, limit)
+            "SELECT id, role, username, content FROM messages WHERE channel_id = ? AND id > ? AND id <= ? "
+            "ORDER BY timestamp DESC, id DESC LIMIT ?",
+            (channel_id, after_id, up_to_id if up_to_id is not None else 2 ** 63 - 1, limit)
         )
         rows = cursor.fetchall()
         # Reverse to get chronological order
         return [
-            {"role": row[0], "username": row[1], "content": row[2]} for row in reversed(rows)
+            {"id": row[0], "role": row[1], "username": row[2], "content": row[3]} for row in reversed(rows)
         ]
 
+def _parse_search_query(query: str):
+    """
+    Splits a /search query into an FTS5 MATCH expression and optional filters.
+    Supports "exact phrases", prefix* terms, user:name, after:YYYY-MM-DD,
+    before:YYYY-MM-DD (Eastern dates) and in:archive. Every term is quoted so
+    user input can never be read as FTS5 syntax. Also returns the bare lowercase
+    terms for matching archived rows, which have no FTS index.
+    """
+    terms = []
+    needles = []
+    filters = {}
+    for match in re.finditer(r'(\w+):("[^"]*"|\S+)|"([^"]*)"|(\S+)', query):
+        key, value, phrase, word = match.groups()
+        if key and key.lower() in ("user", "after", "before", "in"):
+            filters[key.lower()] = value.strip('"')
+            continue
+        if key:
+            word = match.group(0)
+        if phrase is not None:
+            if phrase.strip():
+                terms.append('"' + phrase.replace('"', '""') + '"')
+                needles.append(phrase.lower())
+            continue
+        prefix = word.endswith("*")
+        word = word.rstrip("*")
+        if not re.search(r"\w", word):
+            continue
+        term = '"' + word.replace('"', '""') + '"'
+        terms.append(term + "*" if prefix else term)
+        needles.append(word.lower())
+    return " ".join(terms), filters, needles
+
+def _local_date_start_str(date_str: str) -> str:
+    # 'YYYY-MM-DD' (Eastern) -> UTC timestamp string comparable with messages.timestamp
+    return local_day_start_str(datetime.strptime(date_str, '%Y-%m-%d').date())
+
 def search_history(channel_id: int, query: str, limit: int = 10) -> List[Dict[str, Any]]:
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.execute(
-            """
-            SELECT role, username, content FROM messages
-            WHERE channel_id = ? AND content LIKE ?
-            ORDER BY id DESC LIMIT ?
-            """,
-            (channel_id, f"%{query}%", limit)
-        )
+    """
+    Full-text search over a channel's messages, best matches (BM25) first.
+    Each result carries a 'snippet' with the matching terms highlighted.
+    With in:archive, archived messages are scanned too when the hot table
+    has fewer than `limit` matches.
+    Raises ValueError if a date filter is malformed.
+    """
+    match_expr, filters, needles = _parse_search_query(query)
+    clauses = ["channel_id = ?"]
+    params: list = [channel_id]
+    if "user" in filters:
+        clauses.append("username = ? COLLATE NOCASE")
+        params.append(filters["user"])
+    try:
+        if "after" in filters:
+            clauses.append("timestamp >= ?")
+            params.append(_local_date_start_str(filters["after"]))
+        if "before" in filters:
+            clauses.append("timestamp < ?")
+            params.append(_local_date_start_str(filters["before"]))
+    except ValueError:
+        raise ValueError("Dates must look like YYYY-MM-DD")
+    with reader() as conn:
+        if match_expr:
+            cursor = conn.execute(
+                f"""
+                SELECT m.role, m.username, m.content, m.timestamp,
+                       snippet(messages_fts, 0, '__', '__', '…', 24)
+                FROM messages_fts
+                JOIN messages m ON m.id = messages_fts.rowid
+                WHERE messages_fts MATCH ? AND {' AND '.join(clauses)}
+                ORDER BY bm25(messages_fts) LIMIT ?
+                """,
+                [match_expr] + params + [limit]
+            )
+        elif len(clauses) > 1:
+            # Filters only (e.g. "user:bob"): newest matching messages, by timestamp like
+            # every other history read (imported rows have high ids but old timestamps)
+            cursor = conn.execute(
+                f"""
+                SELECT m.role, m.username, m.content, m.timestamp, m.content
+                FROM messages m
+                WHERE {' AND '.join(clauses)}
+                ORDER BY m.timestamp DESC, m.id DESC LIMIT ?
+                """,
+                params + [limit]
+            )
+        else:
+            return []
         rows = cursor.fetchall()
-        return [
-            {"role": row[0], "username": row[1], "content": row[2]} for row in rows
+        results = [
+            {"role": row[0], "username": row[1], "content": row[2], "timestamp": row[3], "snippet": row[4]}
+            for row in rows
         ]
+        if filters.get("in", "").lower() == "archive" and len(results) < limit:
+            # The archive has no FTS index: scan the channel's archived rows newest first
+            cursor = conn.execute(
+                f"""
+                SELECT role, username, content, timestamp FROM messages_archive
+                WHERE {' AND '.join(clauses)}
+                ORDER BY timestamp DESC, id DESC
+                """,
+                params
+            )
+            for role, username, packed, timestamp in cursor:
+                content = _unpack_content(packed)
+                lowered = (content or "").lower()
+                if all(needle in lowered for needle in needles):
+                    results.append({"role": role, "username": username, "content": content, "timestamp": timestamp, "snippet": content})
+                    if len(results) >= limit:
+                        break
+        return results
 
 def get_last_imported_message_id(channel_id: int) -> int:
-    with sqlite3.connect(DB_PATH) as conn:
+    with reader() as conn:
         cursor = conn.execute(
             "SELECT last_message_id FROM import_state WHERE channel_id = ?",
             (channel_id,)
@@ -113,40 +263,38 @@ def get_last_imported_message_id(channel_id: int) -> int:
         return row[0] if row else 0
 
 def set_last_imported_message_id(channel_id: int, message_id: int):
-    with sqlite3.connect(DB_PATH) as conn:
+    with writer() as conn:
         conn.execute(
             "INSERT OR REPLACE INTO import_state (channel_id, last_message_id) VALUES (?, ?)",
             (channel_id, message_id)
         )
-        conn.commit()
 
 def get_messages_after_user_last(channel_id: int, username: str) -> List[Dict[str, Any]]:
-    with sqlite3.connect(DB_PATH) as conn:
-        # Find the last message id sent by the user in this channel
+    with reader() as conn:
+        # Find the latest message the user sent in this channel
         cursor = conn.execute(
             """
-            SELECT id FROM messages
+            SELECT timestamp, id FROM messages
             WHERE channel_id = ? AND username = ?
-            ORDER BY id DESC LIMIT 1
+            ORDER BY timestamp DESC, id DESC LIMIT 1
             """,
             (channel_id, username)
         )
         row = cursor.fetchone()
         if not row:
             return []
-        last_user_id = row[0]
-        # Get all messages after that id
+        # Get all messages after it, by time (imported history has high ids for old messages)
         cursor = conn.execute(
             """
-            SELECT role, username, content FROM messages
-            WHERE channel_id = ? AND id > ?
-            ORDER BY id ASC
+            SELECT role, username, content, timestamp FROM messages
+            WHERE channel_id = ? AND (timestamp, id) > (?, ?)
+            ORDER BY timestamp ASC, id ASC
             """,
-            (channel_id, last_user_id)
+            (channel_id, row[0], row[1])
         )
         rows = cursor.fetchall()
         return [
-            {"role": r[0], "username": r[1], "content": r[2]} for r in rows
+            {"role": r[0], "username": r[1], "content": r[2], "timestamp": r[3]} for r in rows
         ]
 
 def message_count(channel_id: int, days: int | str) -> int:
@@ -154,164 +302,167 @@ def message_count(channel_id: int, days: int | str) -> int:
     Returns the number of messages sent in the given channel in the last `days` days, or all time if days == 'all'.
     If days == 0, returns the count for just today (EST), using the same logic as /funniest.
     If days == 'yesterday', returns the count for just yesterday (EST).
+    A number N counts today plus the previous N-1 days (EST).
+    Answered from the message_counts_daily rollup, so archived or pruned messages still count.
     """
-    with sqlite3.connect(DB_PATH) as conn:
+    today = today_local()
+    with reader() as conn:
         if days == 'all':
             cursor = conn.execute(
-                "SELECT COUNT(*) FROM messages WHERE channel_id = ?",
+                "SELECT SUM(count) FROM message_counts_daily WHERE channel_id = ?",
                 (channel_id,)
             )
-            row = cursor.fetchone()
-            return row[0] if row else 0
-        elif days == 0:
-            from datetime import datetime, time, timezone
-            try:
-                from zoneinfo import ZoneInfo
-                eastern = ZoneInfo('America/New_York')
-            except ImportError:
-                import pytz
-                eastern = pytz.timezone('America/New_York')
-            now_est = datetime.now(eastern)
-            today_start_est = datetime.combine(now_est.date(), time(hour=0, minute=0), tzinfo=eastern)
-            today_start_utc = today_start_est.astimezone(timezone.utc)
-            today_start_str = today_start_utc.strftime('%Y-%m-%d %H:%M:%S')
+        elif days == 0 or days == 'yesterday':
+            day = today if days == 0 else today - timedelta(days=1)
             cursor = conn.execute(
-                """
-                SELECT COUNT(*) FROM messages
-                WHERE channel_id = ? AND timestamp >= ?
-                """,
-                (channel_id, today_start_str)
+                "SELECT SUM(count) FROM message_counts_daily WHERE channel_id = ? AND local_date = ?",
+                (channel_id, day.isoformat())
             )
-            row = cursor.fetchone()
-            return row[0] if row else 0
-        elif days == 'yesterday':
-            from datetime import datetime, time, timedelta, timezone
-            try:
-                from zoneinfo import ZoneInfo
-                eastern = ZoneInfo('America/New_York')
-            except ImportError:
-                import pytz
-                eastern = pytz.timezone('America/New_York')
-            now_est = datetime.now(eastern)
-            yesterday_date = now_est.date() - timedelta(days=1)
-            y_start_est = datetime.combine(yesterday_date, time(hour=0, minute=0), tzinfo=eastern)
-            y_end_est = datetime.combine(now_est.date(), time(hour=0, minute=0), tzinfo=eastern)
-            y_start_utc = y_start_est.astimezone(timezone.utc)
-            y_end_utc = y_end_est.astimezone(timezone.utc)
-            y_start_str = y_start_utc.strftime('%Y-%m-%d %H:%M:%S')
-            y_end_str = y_end_utc.strftime('%Y-%m-%d %H:%M:%S')
-            cursor = conn.execute(
-                """
-                SELECT COUNT(*) FROM messages
-                WHERE channel_id = ? AND timestamp >= ? AND timestamp < ?
-                """,
-                (channel_id, y_start_str, y_end_str)
-            )
-            row = cursor.fetchone()
-            return row[0] if row else 0
         else:
+            first_day = today - timedelta(days=max(int(days), 1) - 1)
             cursor = conn.execute(
-                """
-                SELECT COUNT(*) FROM messages
-                WHERE channel_id = ? AND timestamp >= datetime('now', ?)
-                """,
-                (channel_id, f'-{days} days')
+                "SELECT SUM(count) FROM message_counts_daily WHERE channel_id = ? AND local_date >= ?",
+                (channel_id, first_day.isoformat())
             )
-            row = cursor.fetchone()
-            return row[0] if row else 0
+        row = cursor.fetchone()
+        return row[0] if row and row[0] else 0
 
-def get_messages_for_timeframe(channel_id: int, timeframe: str) -> List[Dict[str, Any]]:
+def _pack_content(content: str | None):
+    # Store zlib-compressed bytes only when that is actually smaller than the text
+    if not content:
+        return content
+    packed = zlib.compress(content.encode("utf-8"), 6)
+    return packed if len(packed) < len(content.encode("utf-8")) else content
+
+def _unpack_content(value) -> str | None:
+    if isinstance(value, bytes):
+        return zlib.decompress(value).decode("utf-8")
+    return value
+
+def archive_cutoffs(max_messages: int = 0, max_days: int = 0) -> Dict[int, tuple[str, int]]:
     """
-    Returns all messages in the given channel for the specified timeframe.
-    timeframe: 'today', 'yesterday', 'this_month', or 'all'
+    Returns channel_id -> (timestamp, id) of the first message to keep hot, for
+    every channel that has rows to archive. A message stays hot while it is
+    within the newest `max_messages` of its channel or younger than `max_days`
+    (0 disables a policy). Messages are ordered by (timestamp, id), not id alone:
+    /import_history inserts old messages with ids above every live one.
     """
-    with sqlite3.connect(DB_PATH) as conn:
-        if timeframe == 'all':
-            cursor = conn.execute(
-                "SELECT role, username, content FROM messages WHERE channel_id = ? ORDER BY id ASC",
-                (channel_id,)
-            )
-        elif timeframe == 'today':
-            from datetime import datetime, time, timezone
-            try:
-                from zoneinfo import ZoneInfo
-                eastern = ZoneInfo('America/New_York')
-            except ImportError:
-                import pytz
-                eastern = pytz.timezone('America/New_York')
-            now_est = datetime.now(eastern)
-            today_start_est = datetime.combine(now_est.date(), time(hour=0, minute=0), tzinfo=eastern)
-            today_start_utc = today_start_est.astimezone(timezone.utc)
-            today_start_str = today_start_utc.strftime('%Y-%m-%d %H:%M:%S')
-            cursor = conn.execute(
-                """
-                SELECT role, username, content FROM messages
-                WHERE channel_id = ? AND timestamp >= ?
-                ORDER BY id ASC
-                """,
-                (channel_id, today_start_str)
-            )
-        elif timeframe == 'yesterday':
-            from datetime import datetime, time, timedelta, timezone
-            try:
-                from zoneinfo import ZoneInfo
-                eastern = ZoneInfo('America/New_York')
-            except ImportError:
-                import pytz
-                eastern = pytz.timezone('America/New_York')
-            now_est = datetime.now(eastern)
-            yesterday_date = now_est.date() - timedelta(days=1)
-            y_start_est = datetime.combine(yesterday_date, time(hour=0, minute=0), tzinfo=eastern)
-            y_end_est = datetime.combine(now_est.date(), time(hour=0, minute=0), tzinfo=eastern)
-            y_start_utc = y_start_est.astimezone(timezone.utc)
-            y_end_utc = y_end_est.astimezone(timezone.utc)
-            y_start_str = y_start_utc.strftime('%Y-%m-%d %H:%M:%S')
-            y_end_str = y_end_utc.strftime('%Y-%m-%d %H:%M:%S')
-            cursor = conn.execute(
-                """
-                SELECT role, username, content FROM messages
-                WHERE channel_id = ? AND timestamp >= ? AND timestamp < ?
-                ORDER BY id ASC
-                """,
-                (channel_id, y_start_str, y_end_str)
-            )
-        elif timeframe == 'this_month':
-            from datetime import datetime, timezone
-            try:
-                from zoneinfo import ZoneInfo
-                eastern = ZoneInfo('America/New_York')
-            except ImportError:
-                import pytz
-                eastern = pytz.timezone('America/New_York')
-            now_est = datetime.now(eastern)
-            month_start_est = now_est.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-            month_start_utc = month_start_est.astimezone(timezone.utc)
-            month_start_str = month_start_utc.strftime('%Y-%m-%d %H:%M:%S')
-            cursor = conn.execute(
-                """
-                SELECT role, username, content FROM messages
-                WHERE channel_id = ? AND timestamp >= ?
-                ORDER BY id ASC
-                """,
-                (channel_id, month_start_str)
-            )
-        else:
-            return []
+    cutoffs = {}
+    if not max_messages and not max_days:
+        return cutoffs
+    with reader() as conn:
+        channels = [row[0] for row in conn.execute("SELECT DISTINCT channel_id FROM messages")]
+        for channel_id in channels:
+            keep_from = []
+            if max_messages:
+                row = conn.execute(
+                    "SELECT timestamp, id FROM messages WHERE channel_id = ? ORDER BY timestamp DESC, id DESC LIMIT 1 OFFSET ?",
+                    (channel_id, max_messages - 1)
+                ).fetchone()
+                if not row:
+                    continue  # Fewer than max_messages rows: nothing to archive
+                keep_from.append(tuple(row))
+            if max_days:
+                since = (datetime.now(timezone.utc) - timedelta(days=max_days)).strftime(TIMESTAMP_FORMAT)
+                keep_from.append((since, 0))
+            keep = min(keep_from)
+            older = conn.execute(
+                "SELECT 1 FROM messages WHERE channel_id = ? AND (timestamp, id) < (?, ?) LIMIT 1",
+                (channel_id, keep[0], keep[1])
+            ).fetchone()
+            if older:
+                cutoffs[channel_id] = keep
+    return cutoffs
+
+def archive_batch(channel_id: int, keep_from: tuple[str, int], batch_size: int = 500) -> int:
+    """
+    Moves up to `batch_size` of the channel's oldest messages before `keep_from`
+    (a (timestamp, id) from archive_cutoffs) into messages_archive in one short
+    transaction. Returns how many rows moved.
+    """
+    with writer() as conn:
+        rows = conn.execute(
+            """
+            SELECT id, channel_id, role, username, content, timestamp, message_id, author_id, created_at FROM messages
+            WHERE channel_id = ? AND (timestamp, id) < (?, ?)
+            ORDER BY timestamp ASC, id ASC LIMIT ?
+            """,
+            (channel_id, keep_from[0], keep_from[1], batch_size)
+        ).fetchall()
+        if not rows:
+            return 0
+        conn.executemany(
+            """
+            INSERT OR REPLACE INTO messages_archive
+                (id, channel_id, role, username, content, timestamp, message_id, author_id, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            [(r[0], r[1], r[2], r[3], _pack_content(r[4]), r[5], r[6], r[7], r[8]) for r in rows]
+        )
+        # Imported and live ids interleave in time, so delete exactly the rows moved
+        conn.executemany("DELETE FROM messages WHERE id = ?", [(r[0],) for r in rows])
+        return len(rows)
+
+def timeframe_bounds(timeframe: str) -> tuple[str | None, str | None] | None:
+    """
+    Returns (start, end) UTC timestamp strings for 'today', 'yesterday', 'this_month'
+    or 'all' using Eastern day boundaries. Either bound may be None (open-ended).
+    Returns None for an unknown timeframe.
+    """
+    today = today_local()
+    if timeframe == 'all':
+        return None, None
+    if timeframe == 'today':
+        return local_day_start_str(today), None
+    if timeframe == 'yesterday':
+        return local_day_start_str(today - timedelta(days=1)), local_day_start_str(today)
+    if timeframe == 'this_month':
+        return local_day_start_str(today.replace(day=1)), None
+    return None
+
+def get_message_chunk(channel_id: int, start: str | None, end: str | None, after: tuple[str, int] | None = None,
+                      chunk_size: int = 500, archived: bool = False) -> tuple[List[Dict[str, Any]], tuple[str, int] | None]:
+    """
+    Returns up to `chunk_size` messages after the (timestamp, id) key `after`
+    between the UTC bounds, oldest first, plus the key to resume after. Keyset
+    pagination keeps every chunk an index range scan and never holds a pooled
+    connection between chunks. Keyed on time, not id: imported history gets
+    high ids for old messages.
+    """
+    table = "messages_archive" if archived else "messages"
+    clauses = ["channel_id = ?"]
+    params: list = [channel_id]
+    if after is not None:
+        clauses.append("(timestamp, id) > (?, ?)")
+        params.extend(after)
+    if start:
+        clauses.append("timestamp >= ?")
+        params.append(start)
+    if end:
+        clauses.append("timestamp < ?")
+        params.append(end)
+    with reader() as conn:
+        cursor = conn.execute(
+            f"SELECT id, role, username, content, timestamp FROM {table} WHERE {' AND '.join(clauses)} "
+            f"ORDER BY timestamp ASC, id ASC LIMIT ?",
+            params + [chunk_size]
+        )
         rows = cursor.fetchall()
-        return [
-            {"role": row[0], "username": row[1], "content": row[2]} for row in rows
-        ]
+    if not rows:
+        return [], after
+    return [
+        {"role": row[1], "username": row[2], "content": _unpack_content(row[3])} for row in rows
+    ], (rows[-1][4], rows[-1][0])
 
 def add_recommendation(title: str):
-    with sqlite3.connect(DB_PATH) as conn:
+    with writer() as conn:
         conn.execute(
             "INSERT OR IGNORE INTO recommendations (title) VALUES (?)",
             (title,)
         )
-        conn.commit()
 
 def mark_recommendation_watched(title: str, username: str):
-    with sqlite3.connect(DB_PATH) as conn:
+    with writer() as conn:
         # Get recommendation id
         cursor = conn.execute(
             "SELECT id FROM recommendations WHERE title = ?",
@@ -325,10 +476,9 @@ def mark_recommendation_watched(title: str, username: str):
             "INSERT OR IGNORE INTO recommendations_watched (recommendation_id, username) VALUES (?, ?)",
             (rec_id, username)
         )
-        conn.commit()
 
 def get_recommendations_with_watchers() -> list[dict]:
-    with sqlite3.connect(DB_PATH) as conn:
+    with reader() as conn:
         cursor = conn.execute('''
             SELECT r.title, GROUP_CONCAT(w.username) as watched_by
             FROM recommendations r
@@ -341,17 +491,16 @@ def get_recommendations_with_watchers() -> list[dict]:
         ]
 
 def add_quote(channel_id: int, message_id: int, username: str, content: str, quoted_by: str):
-    with sqlite3.connect(DB_PATH) as conn:
+    with writer() as conn:
         conn.execute(
             "INSERT INTO quotes (channel_id, message_id, username, content, quoted_by) VALUES (?, ?, ?, ?, ?)",
             (channel_id, message_id, username, content, quoted_by)
         )
-        conn.commit()
 
 from typing import Optional
 
 def get_quotes(channel_id: Optional[int] = None, limit: int = 10):
-    with sqlite3.connect(DB_PATH) as conn:
+    with reader() as conn:
         if channel_id:
             cursor = conn.execute(
                 "SELECT username, content, quoted_by, timestamp FROM quotes WHERE channel_id = ? ORDER BY id DESC LIMIT ?",
@@ -366,25 +515,37 @@ def get_quotes(channel_id: Optional[int] = None, limit: int = 10):
             {"username": row[0], "content": row[1], "quoted_by": row[2], "timestamp": row[3]} for row in cursor.fetchall()
         ]
 
+def load_channel_personalities():
+    global _personalities, _personalities_loaded_at
+    with reader() as conn:
+        rows = conn.execute("SELECT channel_id, personality FROM channel_personalities").fetchall()
+    with _personalities_lock:
+        _personalities = {row[0]: row[1] for row in rows}
+        _personalities_loaded_at = monotonic()
+
+def personality_cache_fresh() -> bool:
+    if _personalities_loaded_at is None:
+        return False
+    return not PERSONALITY_CACHE_TTL or monotonic() - _personalities_loaded_at < PERSONALITY_CACHE_TTL
+
 def set_channel_personality(channel_id: int, personality: str):
-    with sqlite3.connect(DB_PATH) as conn:
+    with writer() as conn:
         conn.execute(
             "INSERT OR REPLACE INTO channel_personalities (channel_id, personality) VALUES (?, ?)",
             (channel_id, personality)
         )
-        conn.commit()
+    # Write-through so the next lookup sees it without a query
+    with _personalities_lock:
+        _personalities[channel_id] = personality
 
 def get_channel_personality(channel_id: int) -> str | None:
-    with sqlite3.connect(DB_PATH) as conn:
-        cursor = conn.execute(
-            "SELECT personality FROM channel_personalities WHERE channel_id = ?",
-            (channel_id,)
-        )
-        row = cursor.fetchone()
-        return row[0] if row else None
+    # Served from the in-memory cache; reloaded only when the TTL has expired
+    if not personality_cache_fresh():
+        load_channel_personalities()
+    return _personalities.get(channel_id)
 
 def get_user_ath(user_id: int):
-    with sqlite3.connect(DB_PATH) as conn:
+    with reader() as conn:
         cursor = conn.execute(
             "SELECT last_ath FROM user_ath WHERE user_id = ?",
             (user_id,)
@@ -393,9 +554,326 @@ def get_user_ath(user_id: int):
         return row[0] if row else None
 
 def set_user_ath(user_id: int, username: str, timestamp: str):
-    with sqlite3.connect(DB_PATH) as conn:
+    with writer() as conn:
         conn.execute(
             "INSERT OR REPLACE INTO user_ath (user_id, username, last_ath) VALUES (?, ?, ?)",
             (user_id, username, timestamp)
         )
-        conn.commit()
+
+def record_reactions(rows: List[tuple]):
+    """
+    Upserts (message_id, channel_id, author_id, author_name, reactor_id, reactor_name,
+    reactor_bot, emoji, message_created_at) rows into the reaction ledger.
+    """
+    with writer() as conn:
+        conn.executemany(
+            """
+            INSERT OR IGNORE INTO reactions
+                (message_id, channel_id, author_id, author_name, reactor_id, reactor_name, reactor_bot, emoji, message_created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            rows
+        )
+        now_str = datetime.now(timezone.utc).strftime(TIMESTAMP_FORMAT)
+        _remember_names(conn, [(row[2], row[3], row[8]) for row in rows] + [(row[4], row[5], now_str) for row in rows])
+
+def remove_reaction(message_id: int, reactor_id: int, emoji: str):
+    with writer() as conn:
+        conn.execute(
+            "DELETE FROM reactions WHERE message_id = ? AND reactor_id = ? AND emoji = ?",
+            (message_id, reactor_id, emoji)
+        )
+
+def clear_reactions(message_id: int, emoji: str | None = None):
+    with writer() as conn:
+        if emoji is None:
+            conn.execute("DELETE FROM reactions WHERE message_id = ?", (message_id,))
+        else:
+            conn.execute("DELETE FROM reactions WHERE message_id = ? AND emoji = ?", (message_id, emoji))
+
+def get_message_author(message_id: int) -> tuple[int | None, str] | None:
+    # Who wrote a Discord message, if we already know it from stored messages or the ledger
+    with reader() as conn:
+        for table in ("messages", "messages_archive"):
+            row = conn.execute(
+                f"SELECT author_id, username FROM {table} WHERE message_id = ? AND role = 'user'",
+                (message_id,)
+            ).fetchone()
+            if row:
+                return row[0], row[1]
+        row = conn.execute(
+            "SELECT author_id, author_name FROM reactions WHERE message_id = ? LIMIT 1",
+            (message_id,)
+        ).fetchone()
+        return (row[0], row[1]) if row else None
+
+def mark_reaction_backfill_done(channel_id: int):
+    with writer() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO reaction_backfill_state (channel_id) VALUES (?)",
+            (channel_id,)
+        )
+
+def reaction_backfill_done(channel_id: int) -> bool:
+    with reader() as conn:
+        row = conn.execute(
+            "SELECT 1 FROM reaction_backfill_state WHERE channel_id = ?",
+            (channel_id,)
+        ).fetchone()
+        return row is not None
+
+def _reaction_window(start: str | None, end: str | None, clauses: list, params: list):
+    if start:
+        clauses.append("message_created_at >= ?")
+        params.append(start)
+    if end:
+        clauses.append("message_created_at < ?")
+        params.append(end)
+
+def _display_names(conn, keys) -> Dict[Any, str]:
+    """
+    Maps leaderboard grouping keys (user ids, or stored names for rows that
+    predate ids) to the name to show: the user's latest name, with the end of
+    the id appended when another user currently has the same name.
+    """
+    ids = [key for key in set(keys) if isinstance(key, int)]
+    names = {}
+    for i in range(0, len(ids), 500):
+        part = ids[i:i + 500]
+        names.update(conn.execute(
+            f"SELECT user_id, name FROM user_names WHERE user_id IN ({','.join('?' * len(part))})", part
+        ).fetchall())
+    shared = set()
+    taken = list(set(names.values()))
+    for i in range(0, len(taken), 500):
+        part = taken[i:i + 500]
+        shared.update(row[0] for row in conn.execute(
+            f"SELECT name FROM user_names WHERE name IN ({','.join('?' * len(part))}) GROUP BY name HAVING COUNT(*) > 1",
+            part
+        ))
+    display = {}
+    for key in keys:
+        if not isinstance(key, int):
+            display[key] = key
+        elif key not in names:
+            display[key] = str(key)
+        else:
+            display[key] = f"{names[key]} (#{str(key)[-4:]})" if names[key] in shared else names[key]
+    return display
+
+def reaction_summary(channel_id: int, start: str | None = None, end: str | None = None) -> Dict[str, Any]:
+    """
+    Aggregates the ledger for messages posted in [start, end) (UTC strings or None):
+    'received' [(emoji, author, count)], 'given' [(emoji, reactor, count)] for
+    non-bot reactors, and 'messages', the number of distinct reacted-to messages.
+    Users are counted by id and shown under their latest name.
+    """
+    clauses = ["channel_id = ?"]
+    params: list = [channel_id]
+    _reaction_window(start, end, clauses, params)
+    where = " AND ".join(clauses)
+    with reader() as conn:
+        received = conn.execute(
+            f"""
+            SELECT emoji, COALESCE(author_id, author_name), COUNT(*) FROM reactions WHERE {where}
+            GROUP BY emoji, COALESCE(author_id, author_name)
+            """,
+            params
+        ).fetchall()
+        given = conn.execute(
+            f"SELECT emoji, reactor_id, COUNT(*) FROM reactions WHERE {where} AND reactor_bot = 0 GROUP BY emoji, reactor_id",
+            params
+        ).fetchall()
+        messages = conn.execute(
+            f"SELECT COUNT(DISTINCT message_id) FROM reactions WHERE {where}",
+            params
+        ).fetchone()[0]
+        names = _display_names(conn, [row[1] for row in received] + [row[1] for row in given])
+    return {
+        "received": [(emoji, names[key], count) for emoji, key, count in received],
+        "given": [(emoji, names[key], count) for emoji, key, count in given],
+        "messages": messages,
+    }
+
+def active_usernames(channel_id: int, start: str | None = None, end: str | None = None) -> set[str]:
+    # Users with at least one stored message in [start, end), hot or archived, under their latest name
+    clauses = ["channel_id = ?", "role = 'user'"]
+    params: list = [channel_id]
+    if start:
+        clauses.append("timestamp >= ?")
+        params.append(start)
+    if end:
+        clauses.append("timestamp < ?")
+        params.append(end)
+    keys = set()
+    with reader() as conn:
+        for table in ("messages", "messages_archive"):
+            cursor = conn.execute(
+                f"SELECT DISTINCT COALESCE(author_id, username) FROM {table} WHERE {' AND '.join(clauses)}",
+                params
+            )
+            keys.update(row[0] for row in cursor.fetchall())
+        names = _display_names(conn, keys)
+    return set(names.values())
+
+def get_reaction_checkpoint(channel_id: int) -> Dict[str, Any] | None:
+    # Coverage of the stored leaderboard buckets for a channel, None if it has none
+    with reader() as conn:
+        row = conn.execute(
+            "SELECT low_bucket, scanned_up_to_id, includes_reactors FROM reaction_scan_state WHERE channel_id = ?",
+            (channel_id,)
+        ).fetchone()
+    if row is None:
+        return None
+    return {"low_bucket": row[0], "scanned_up_to_id": row[1], "includes_reactors": bool(row[2])}
+
+def save_reaction_scan(channel_id: int, counts: Dict[tuple, int], low_bucket: str, scanned_up_to_id: int | None,
+                       includes_reactors: bool, replace_from: str | None = None, reset: bool = False):
+    """
+    Merges one crawl into the channel's leaderboard buckets and moves its
+    checkpoint, in one transaction. counts maps (bucket, metric, emoji, username)
+    to a count. Buckets from replace_from onwards (or all of them with reset)
+    are dropped first because the crawl re-counted them.
+    """
+    with writer() as conn:
+        if reset:
+            conn.execute("DELETE FROM reaction_scan_buckets WHERE channel_id = ?", (channel_id,))
+        elif replace_from is not None:
+            conn.execute(
+                "DELETE FROM reaction_scan_buckets WHERE channel_id = ? AND bucket >= ?",
+                (channel_id, replace_from)
+            )
+        conn.executemany(
+            """
+            INSERT INTO reaction_scan_buckets (channel_id, bucket, metric, emoji, username, count)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (channel_id, bucket, metric, emoji, username) DO UPDATE SET count = count + excluded.count
+            """,
+            [(channel_id,) + key + (n,) for key, n in counts.items()]
+        )
+        conn.execute(
+            """
+            INSERT OR REPLACE INTO reaction_scan_state (channel_id, low_bucket, scanned_up_to_id, includes_reactors, updated_at)
+            VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+            """,
+            (channel_id, low_bucket, scanned_up_to_id, int(includes_reactors))
+        )
+
+def reaction_scan_totals(channel_id: int, start: str | None = None, end: str | None = None) -> List[tuple]:
+    # (metric, emoji, username, count) summed over the buckets in [start, end)
+    clauses = ["channel_id = ?"]
+    params: list = [channel_id]
+    if start:
+        clauses.append("bucket >= ?")
+        params.append(start)
+    if end:
+        clauses.append("bucket < ?")
+        params.append(end)
+    with reader() as conn:
+        return conn.execute(
+            f"""
+            SELECT metric, emoji, username, SUM(count) FROM reaction_scan_buckets
+            WHERE {' AND '.join(clauses)}
+            GROUP BY metric, emoji, username
+            """,
+            params
+        ).fetchall()
+
+def get_cached_response(key: str, max_age_seconds: int) -> tuple[str, float] | None:
+    # (response, stored at as a unix timestamp) if the entry exists and hasn't expired
+    with reader() as conn:
+        row = conn.execute(
+            """
+            SELECT response, CAST(strftime('%s', created_at) AS REAL) FROM llm_response_cache
+            WHERE key = ? AND created_at >= datetime('now', ?)
+            """,
+            (key, f"-{int(max_age_seconds)} seconds")
+        ).fetchone()
+    return (row[0], row[1]) if row else None
+
+def set_cached_response(key: str, response: str, max_age_seconds: int, max_entries: int):
+    # Stores a response and drops expired entries and the oldest ones past max_entries
+    with writer() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO llm_response_cache (key, response, created_at) VALUES (?, ?, CURRENT_TIMESTAMP)",
+            (key, response)
+        )
+        conn.execute(
+            "DELETE FROM llm_response_cache WHERE created_at < datetime('now', ?)",
+            (f"-{int(max_age_seconds)} seconds",)
+        )
+        conn.execute(
+            """
+            DELETE FROM llm_response_cache WHERE key IN (
+                SELECT key FROM llm_response_cache ORDER BY created_at DESC LIMIT -1 OFFSET ?
+            )
+            """,
+            (max_entries,)
+        )
+
+def daily_user_message_totals(channel_id: int, first_day: str | None, last_day: str) -> Dict[str, int]:
+    """
+    local_date -> people's (role 'user') messages, hot and archived, for each
+    day in [first_day, last_day) with any: what a daily summary covers. Bot
+    replies are left out so they never make a summarized day look changed.
+    Counted per UTC hour; Eastern offsets are whole hours, so hours map
+    cleanly onto local days.
+    """
+    clauses = ["channel_id = ?", "role = 'user'", "timestamp < ?"]
+    params: list = [channel_id, local_day_start_str(date.fromisoformat(last_day))]
+    if first_day:
+        clauses.append("timestamp >= ?")
+        params.append(local_day_start_str(date.fromisoformat(first_day)))
+    totals = Counter()
+    with reader() as conn:
+        for table in ("messages_archive", "messages"):
+            for hour, n in conn.execute(
+                f"SELECT strftime('%Y-%m-%d %H:00:00', timestamp) AS hour, COUNT(*) FROM {table} "
+                f"WHERE {' AND '.join(clauses)} GROUP BY hour",
+                params
+            ):
+                if hour is not None:
+                    totals[local_date_of(hour).isoformat()] += n
+    return dict(totals)
+
+def channels_with_messages_since(first_day: str | None) -> List[int]:
+    with reader() as conn:
+        if first_day:
+            rows = conn.execute(
+                "SELECT DISTINCT channel_id FROM message_counts_daily WHERE local_date >= ?", (first_day,)
+            ).fetchall()
+        else:
+            rows = conn.execute("SELECT DISTINCT channel_id FROM message_counts_daily").fetchall()
+    return [row[0] for row in rows]
+
+def get_daily_summaries(channel_id: int, first_day: str | None, last_day: str) -> Dict[str, tuple[str, int]]:
+    # local_date -> (summary, message_count) for stored days in [first_day, last_day)
+    clauses = ["channel_id = ?", "local_date < ?"]
+    params: list = [channel_id, last_day]
+    if first_day:
+        clauses.append("local_date >= ?")
+        params.append(first_day)
+    with reader() as conn:
+        rows = conn.execute(
+            f"SELECT local_date, summary, message_count FROM channel_daily_summaries WHERE {' AND '.join(clauses)}",
+            params
+        ).fetchall()
+    return {day: (summary, n) for day, summary, n in rows}
+
+def save_daily_summary(channel_id: int, local_date: str, summary: str, message_count: int):
+    with writer() as conn:
+        conn.execute(
+            """
+            INSERT OR REPLACE INTO channel_daily_summaries (channel_id, local_date, summary, message_count, created_at)
+            VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+            """,
+            (channel_id, local_date, summary, message_count)
+        )
+
+def count_messages() -> int:
+    with reader() as conn:
+        cursor = conn.execute("SELECT COUNT(*) FROM messages")
+        return cursor.fetchone()[0]
+
+# Warm the personality cache at startup
+load_channel_personalities()
@@ -0,0 +1,101 @@
+# Shared SQLite connection layer: one long-lived writer plus a small pool of readers
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+DB_PATH = os.getenv("DB_PATH", "data/history.db")
+READER_POOL_SIZE = int(os.getenv("DB_READER_POOL_SIZE", "4"))
+MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(256 * 1024 * 1024)))  # bytes
+CACHE_SIZE_KIB = int(os.getenv("DB_CACHE_SIZE_KIB", "65536"))  # per connection
+BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+
+_writer_conn = None
+_writer_lock = threading.RLock()
+_readers = queue.LifoQueue()
+_readers_created = 0
+_readers_lock = threading.Lock()
+
+def _connect(read_only: bool = False) -> sqlite3.Connection:
+    # check_same_thread=False: connections are handed between threads, but only
+    # ever used by one thread at a time (writer lock / reader checkout)
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False, timeout=BUSY_TIMEOUT_MS / 1000)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+    conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KIB}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    if read_only:
+        conn.execute("PRAGMA query_only=ON")
+    return conn
+
+@contextmanager
+def writer():
+    """
+    Yields the shared writer connection. Only one thread may hold it at a time.
+    Commits when the block exits cleanly and rolls back if it raises.
+    Nested use from the same thread joins the outer transaction.
+    """
+    global _writer_conn
+    with _writer_lock:
+        if _writer_conn is None:
+            _writer_conn = _connect()
+        outermost = not _writer_conn.in_transaction
+        try:
+            yield _writer_conn
+            if outermost:
+                _writer_conn.commit()
+        except BaseException:
+            if outermost:
+                _writer_conn.rollback()
+            raise
+
+@contextmanager
+def reader():
+    """
+    Checks a read-only connection out of the pool. WAL mode lets readers run
+    alongside the writer, so lookups never queue behind an in-flight commit.
+    """
+    global _readers_created
+    try:
+        conn = _readers.get_nowait()
+    except queue.Empty:
+        conn = None
+        with _readers_lock:
+            if _readers_created < READER_POOL_SIZE:
+                _readers_created += 1
+                create = True
+            else:
+                create = False
+        if create:
+            try:
+                conn = _connect(read_only=True)
+            except Exception:
+                with _readers_lock:
+                    _readers_created -= 1
+                raise
+        else:
+            conn = _readers.get()
+    try:
+        yield conn
+    finally:
+        # End any implicit read transaction so the WAL can checkpoint
+        if conn.in_transaction:
+            conn.rollback()
+        _readers.put(conn)
+
+def close_all():
+    global _writer_conn, _readers_created
+    with _writer_lock:
+        if _writer_conn is not None:
+            _writer_conn.close()
+            _writer_conn = None
+    with _readers_lock:
+        while True:
+            try:
+                _readers.get_nowait().close()
+            except queue.Empty:
+                break
+        _readers_created = 0
@@ -24,7 +24,7 @@ def add_finance_commands(bot):
     @bot.tree.command(name="ath", description="Announce you hit an all time high on net worth!")
     async def ath(interaction: discord.Interaction):
         """Announces a user's all time high, shows a gif, and the last time they hit an ATH."""
-        import db
+        import adb
         from datetime import datetime
         try:
             from zoneinfo import ZoneInfo
@@ -37,7 +37,7 @@ def add_finance_commands(bot):
         await interaction.response.defer()
         user_id = interaction.user.id
         username = interaction.user.display_name
-        last_ath = db.get_user_ath(user_id)  # Fetch before updating
+        last_ath = await adb.get_user_ath(user_id)  # Fetch before updating
         gif_url = "https://tenor.com/view/kucoin-kcs-ethereum-eth-bitcoin-gif-18569399"
         if last_ath:
             try:
@@ -62,6 +62,6 @@ def add_finance_commands(bot):
             msg = f"<@{user_id}> just hit a new ALL TIME HIGH on net worth! 🚀\nLast ATH: {ago_str}"
         else:
             msg = f"<@{user_id}> just hit their FIRST ALL TIME HIGH on net worth! 🚀"
-        db.set_user_ath(user_id, username, now_str)  # Update after calculating difference
+        await adb.set_user_ath(user_id, username, now_str)  # Update after calculating difference
         await interaction.followup.send(msg)
         await interaction.followup.send(gif_url)
\ No newline at end of file
@@ -1,7 +1,10 @@
 import discord
-from db import get_history, add_message, get_last_imported_message_id, set_last_imported_message_id, search_history, message_count
 import os
-from db import add_quote, get_quotes
+import adb
+import jobs
+from crawler import crawl_history
+
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "750"))
 
 def add_historian_commands(bot):
     @bot.tree.command(name="history", description="Show the conversation history for this channel")
@@ -10,7 +13,7 @@ def add_historian_commands(bot):
         if channel_id is None:
             await interaction.followup.send("Could not determine channel ID.")
             return
-        history = get_history(channel_id, 1000)
+        history = await adb.get_history(channel_id, 1000)
         if not history:
             await interaction.followup.send("No conversation history for this channel.")
             return
@@ -45,29 +48,53 @@ def add_historian_commands(bot):
             await interaction.response.send_message("Could not determine channel ID.", ephemeral=True)
             return
         await interaction.response.defer(thinking=True, ephemeral=True)
-        last_imported_id = get_last_imported_message_id(channel_id)
-        imported = 0
-        last_seen_id = last_imported_id
-        async for msg in channel.history(limit=None, oldest_first=True, after=None):
-            if last_imported_id and msg.id <= last_imported_id:
-                continue
-            if msg.author.bot:
-                continue
-            add_message(channel_id, "user", msg.author.name, msg.content)
-            imported += 1
-            last_seen_id = msg.id
-        if imported > 0 and last_seen_id:
-            set_last_imported_message_id(channel_id, last_seen_id)
-        await interaction.followup.send(f"Imported {imported} new messages from this channel.")
+        # Resume from the checkpoint; the unique message_id key makes any overlap harmless
+        last_imported_id = await adb.get_last_imported_message_id(channel_id)
+        after = discord.Object(id=last_imported_id) if last_imported_id else None
+
+        async def run_import(report):
+            imported = 0
+            scanned = 0
+            batch = []
+            last_seen_id = last_imported_id
+            async for msg in crawl_history(channel, after=after):
+                scanned += 1
+                last_seen_id = msg.id
+                if not msg.author.bot:
+                    batch.append((channel_id, "user", msg.author.name, msg.content,
+                                  msg.id, msg.author.id, msg.created_at.strftime('%Y-%m-%d %H:%M:%S')))
+                if scanned % IMPORT_BATCH_SIZE == 0:
+                    # One transaction per batch, checkpoint included
+                    imported += await adb.import_messages(channel_id, batch, last_seen_id)
+                    batch = []
+                    await report((scanned, imported))
+            if last_seen_id and last_seen_id != last_imported_id:
+                imported += await adb.import_messages(channel_id, batch, last_seen_id)
+            return imported
 
-    @bot.tree.command(name="search", description="Search the conversation history for a keyword in this channel")
-    @discord.app_commands.describe(query="The keyword or phrase to search for")
+        async def progress(counts):
+            scanned, imported = counts
+            await interaction.edit_original_response(content=f"⏳ Scanned {scanned:,} messages, imported {imported:,} so far...")
+        try:
+            imported = await jobs.run(("import_history", channel_id, "all"), interaction.user.id, run_import, progress)
+        except jobs.JobCancelled:
+            # Every finished batch is committed with its checkpoint, so a rerun picks up from here
+            await interaction.edit_original_response(content="🛑 Import cancelled. Run /import_history again to resume.")
+            return
+        await interaction.edit_original_response(content=f"Imported {imported} new messages from this channel.")
+
+    @bot.tree.command(name="search", description="Search the conversation history in this channel (supports \"phrases\", prefix*, user:, after:, before:)")
+    @discord.app_commands.describe(query="Keywords, \"exact phrase\" or prefix*, optionally with user:name, after:YYYY-MM-DD, before:YYYY-MM-DD")
     async def search(interaction: discord.Interaction, query: str):
         channel_id = getattr(interaction, "channel_id", None)
         if channel_id is None:
             await interaction.response.send_message("Could not determine channel ID.")
             return
-        results = search_history(channel_id, query, limit=10)
+        try:
+            results = await adb.search_history(channel_id, query, limit=10)
+        except ValueError as e:
+            await interaction.response.send_message(f"Invalid search: {e}")
+            return
         if not results:
             await interaction.response.send_message(f"No results found for '{query}'.")
             return
@@ -75,12 +102,13 @@ def add_historian_commands(bot):
         for msg in results:
             role = msg.get("role", "user")
             username = msg.get("username", "user")
-            content = msg.get("content", "")
-            formatted.append(f"**{username} ({role.capitalize()}):** {content}")
+            snippet = msg.get("snippet") or msg.get("content", "")
+            date = (msg.get("timestamp") or "")[:10]
+            formatted.append(f"**{username} ({role.capitalize()}) {date}:** {snippet}")
         output = "\n".join(formatted)
+        # Results are ranked best-first, so keep the top of the list
         if len(output) > 1900:
-            output = output[-1900:]
-            output = "...\n" + output
+            output = output[:1900] + "\n..."
         await interaction.response.send_message(output)
 
     @bot.tree.command(name="message_count", description="Show how many messages have been sent in this channel in the last N days")
@@ -91,20 +119,20 @@ def add_historian_commands(bot):
             await interaction.response.send_message("Could not determine channel ID.")
             return
         if days.lower() == 'all':
-            count = message_count(channel_id, 'all')
+            count = await adb.message_count(channel_id, 'all')
             await interaction.response.send_message(f"{count} messages have been sent all time in this channel.")
         elif days.lower() == 'today':
             from datetime import datetime, timezone
             now = datetime.now(timezone.utc)
-            count = message_count(channel_id, 0)
+            count = await adb.message_count(channel_id, 0)
             await interaction.response.send_message(f"{count} messages have been sent today in this channel.")
         elif days.lower() == 'yesterday':
-            count = message_count(channel_id, 'yesterday')
+            count = await adb.message_count(channel_id, 'yesterday')
             await interaction.response.send_message(f"{count} messages have been sent yesterday in this channel.")
         else:
             try:
                 days_int = int(days)
-                count = message_count(channel_id, days_int)
+                count = await adb.message_count(channel_id, days_int)
                 await interaction.response.send_message(f"{count} messages have been sent in the last {days_int} day(s) in this channel.")
             except ValueError:
                 await interaction.response.send_message("Please provide a number of days (e.g. 7), 'today', 'yesterday', or 'all'.")
@@ -116,7 +144,7 @@ def add_historian_commands(bot):
             await interaction.response.send_message("Could not determine channel ID.", ephemeral=True)
             return
         channel_id = channel.id
-        add_quote(channel_id, message.id, message.author.name, message.content, interaction.user.name)
+        await adb.add_quote(channel_id, message.id, message.author.name, message.content, interaction.user.name)
         await interaction.response.send_message(f"Quoted {message.author.name}: '{message.content[:100]}...' to the Hall of Fame!", ephemeral=True)
 
     @bot.tree.command(name="quote", description="Show recent Hall of Fame quotes for this channel")
@@ -125,7 +153,7 @@ def add_historian_commands(bot):
         if channel_id is None:
             await interaction.response.send_message("Could not determine channel ID.")
             return
-        quotes = get_quotes(channel_id, limit=5)
+        quotes = await adb.get_quotes(channel_id, limit=5)
         if not quotes:
             await interaction.response.send_message("No Hall of Fame quotes yet for this channel.")
             return
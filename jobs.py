@@ -0,0 +1,75 @@
+# Singleflight registry for long-running scans: identical requests share one job
+import asyncio
+import os
+import time
+
+PROGRESS_EDIT_SECONDS = float(os.getenv("PROGRESS_EDIT_SECONDS", "3"))
+
+_jobs = {}  # (command, channel_id, window, ...) -> Job
+
+class JobCancelled(Exception):
+    """Raised to every waiter when a shared job is cancelled."""
+    def __init__(self, cancelled_by: str | None = None):
+        super().__init__("cancelled")
+        self.cancelled_by = cancelled_by
+
+class Job:
+    """
+    One running scan. Waiters subscribe a progress callback; progress is
+    broadcast to all of them at most once every PROGRESS_EDIT_SECONDS.
+    """
+    def __init__(self, key: tuple, owner_id: int):
+        self.key = key
+        self.owner_id = owner_id
+        self.started_at = time.monotonic()
+        self.progress = None
+        self.cancelled_by = None
+        self.task = None
+        self._listeners = []
+        self._last_broadcast = 0.0
+
+    async def report(self, progress):
+        # Called by the job as often as it likes; only a throttled subset reaches the waiters
+        self.progress = progress
+        if time.monotonic() - self._last_broadcast < PROGRESS_EDIT_SECONDS:
+            return
+        self._last_broadcast = time.monotonic()
+        for listener in list(self._listeners):
+            try:
+                await listener(progress)
+            except Exception as e:
+                print("Error reporting job progress:", e)
+
+    def cancel(self, cancelled_by: str | None = None) -> bool:
+        if self.task is None or self.task.done():
+            return False
+        self.cancelled_by = cancelled_by
+        return self.task.cancel()
+
+async def run(key: tuple, owner_id: int, factory, on_progress=None):
+    """
+    Runs factory(report) as the job for `key`, or joins the one already running.
+    Every caller gets the same result (or exception); JobCancelled when the job
+    is cancelled. A caller giving up doesn't stop the job for the others.
+    """
+    job = _jobs.get(key)
+    if job is None:
+        job = Job(key, owner_id)
+        job.task = asyncio.create_task(factory(job.report))
+        _jobs[key] = job
+        job.task.add_done_callback(lambda _: _jobs.pop(key, None) if _jobs.get(key) is job else None)
+    if on_progress is not None:
+        job._listeners.append(on_progress)
+    try:
+        return await asyncio.shield(job.task)
+    except asyncio.CancelledError:
+        if job.task.cancelled():
+            raise JobCancelled(job.cancelled_by) from None
+        raise
+    finally:
+        if on_progress is not None:
+            job._listeners.remove(on_progress)
+
+def running(channel_id: int) -> list[Job]:
+    # Jobs in progress for a channel, oldest first
+    return sorted((job for key, job in _jobs.items() if key[1] == channel_id), key=lambda job: job.started_at)
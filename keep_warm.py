@@ -0,0 +1,64 @@
+# Keeps the Ollama model in memory: loads it at startup and renews it during active hours
+import asyncio
+import os
+from datetime import datetime
+import db
+import llm_scheduler
+from ollama_client import OLLAMA_MODEL, load_model
+
+WARM_UP_ON_START = os.getenv("WARM_UP_ON_START", "1") == "1"
+# Eastern hours when the model is kept loaded even without traffic, e.g. "8-23" or "7-9,17-1" ("" = off)
+KEEP_WARM_HOURS = os.getenv("KEEP_WARM_HOURS", "")
+KEEP_WARM_INTERVAL_SECONDS = int(os.getenv("KEEP_WARM_INTERVAL_SECONDS", "240"))  # keep below OLLAMA_KEEP_ALIVE
+
+_task = None
+last_load = None  # (finished at, seconds taken or None, error or None) of the latest warm-up
+
+def _parse_hours(spec: str) -> list[tuple[int, int]]:
+    ranges = []
+    for part in spec.split(","):
+        start, _, end = part.strip().partition("-")
+        if start.strip().isdigit() and end.strip().isdigit():
+            ranges.append((int(start) % 24, int(end) % 24))
+    return ranges
+
+KEEP_WARM_RANGES = _parse_hours(KEEP_WARM_HOURS)
+
+def in_active_hours(now: datetime | None = None) -> bool:
+    # Ranges include their start hour and end before their end hour; "20-2" wraps past midnight
+    hour = (now or datetime.now(db.EASTERN)).hour
+    for start, end in KEEP_WARM_RANGES:
+        if start == end or (start < end and start <= hour < end) or (start > end and (hour >= start or hour < end)):
+            return True
+    return False
+
+async def warm_up(ollama_url: str) -> bool:
+    # Loads (or renews) the model; failures are logged, never raised
+    global last_load
+    try:
+        seconds = await load_model(ollama_url)
+    except Exception as e:
+        last_load = (datetime.now(db.EASTERN), None, str(e) or type(e).__name__)
+        print(f"Error warming up {OLLAMA_MODEL}:", last_load[2])
+        return False
+    last_load = (datetime.now(db.EASTERN), seconds, None)
+    return True
+
+async def _keep_warm_loop(ollama_url: str):
+    if WARM_UP_ON_START:
+        await warm_up(ollama_url)
+    if not KEEP_WARM_RANGES:
+        return
+    while True:
+        await asyncio.sleep(KEEP_WARM_INTERVAL_SECONDS)
+        # A request in flight already keeps the model loaded
+        if in_active_hours() and not llm_scheduler.status()["in_flight"]:
+            await warm_up(ollama_url)
+
+def start_keep_warm(ollama_url: str):
+    # Safe to call on every on_ready (reconnects fire it again)
+    global _task
+    if not WARM_UP_ON_START and not KEEP_WARM_RANGES:
+        return
+    if _task is None:
+        _task = asyncio.create_task(_keep_warm_loop(ollama_url))
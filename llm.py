@@ -1,111 +1,148 @@
 import discord
 from discord import app_commands
-import asyncio
-from ollama_client import ask_ollama
-from db import add_message, get_history, get_messages_after_user_last, get_messages_for_timeframe, get_channel_personality, set_channel_personality
+import re
+from datetime import datetime, timezone
+import chat_sessions
+import daily_summaries
+import db
+import keep_warm
+import llm_scheduler
+import summarizer
+from llm_stream import InteractionTarget, scheduled_reply
+from ollama_client import OLLAMA_MODEL, OLLAMA_OPTIONS, interaction_expired, keep_alive_for, loaded_models
+import adb
 from sports.mlb import get_live_mlb_games
 from sports.nba import get_live_nba_games
 from sports.nfl import get_live_nfl_games
-import re
-from util import fix_mojibake  # Import the mojibake fixer
 import os
 
 # These will be injected from the main bot file
 OLLAMA_URL = None
 HISTORY_LIMIT = None
 
+async def _edit_progress(interaction, text):
+    if interaction_expired(interaction):
+        return
+    try:
+        await interaction.edit_original_response(content=text)
+    except discord.HTTPException:
+        pass
+
+def _condense_error(e):
+    if isinstance(e, llm_scheduler.QueueFull):
+        return "🦙 The llama is swamped right now. Please try again in a minute."
+    return str(e)
+
+async def _condensed_text(interaction, channel_id, message_chunks):
+    """
+    Runs summarizer.condense for a deferred interaction, showing progress on it.
+    Returns the text to summarize, "" when there are no messages, or None after
+    telling the user why summarizing failed.
+    """
+    async def progress(parts_done):
+        await _edit_progress(interaction, f"⏳ Summarized {parts_done:,} parts of the conversation so far...")
+    try:
+        condensed = await summarizer.condense(channel_id, message_chunks, OLLAMA_URL, progress)
+    except (llm_scheduler.QueueFull, RuntimeError) as e:
+        # Condensing can outlive the interaction; the target falls back to the channel
+        await InteractionTarget(interaction).follow_up(_condense_error(e))
+        return None
+    if condensed is None:
+        return ""
+    text, is_summaries = condensed
+    if is_summaries:
+        text = "Summaries of consecutive parts of the conversation, oldest first:\n\n" + text
+    return text
+
+async def _single_chunk(messages):
+    yield messages
+
+async def _chained(*message_chunks):
+    # The chunks of each async iterator in turn
+    for chunks in message_chunks:
+        async for chunk in chunks:
+            yield chunk
+
+def _gigabytes(size) -> str:
+    return f"{(size or 0) / 1e9:.1f} GB"
+
+def _unloads_in(expires_at: str | None) -> str:
+    # /api/ps gives RFC 3339 times with nanoseconds; trim them for fromisoformat
+    if not expires_at:
+        return "unknown"
+    try:
+        expires = datetime.fromisoformat(re.sub(r"(\.\d{6})\d+", r"\1", expires_at.replace("Z", "+00:00")))
+    except ValueError:
+        return "unknown"
+    minutes = (expires - datetime.now(timezone.utc)).total_seconds() / 60
+    if minutes > 60 * 24 * 365:
+        return "stays loaded"
+    if minutes < 1:
+        return "unloads in under a minute"
+    return f"unloads in {minutes:.0f} min" if minutes < 120 else f"unloads in {minutes / 60:.1f} h"
+
+def _llm_status_text(models) -> str:
+    lines = [f"**Model:** `{OLLAMA_MODEL}` (keep_alive `{keep_alive_for(OLLAMA_MODEL)}`, context {OLLAMA_OPTIONS['num_ctx']:,} tokens)"]
+    if models is None:
+        lines.append("**Loaded:** couldn't reach Ollama")
+    elif not models:
+        lines.append(f"**Loaded:** nothing, the next request loads `{OLLAMA_MODEL}` first")
+    else:
+        lines.append("**Loaded:**")
+        for model in models:
+            lines.append(f"- `{model.get('name')}`: {_gigabytes(model.get('size'))} "
+                         f"({_gigabytes(model.get('size_vram'))} in VRAM), {_unloads_in(model.get('expires_at'))}")
+    queue = llm_scheduler.status()
+    lines.append(f"**Queue:** {queue['in_flight']}/{queue['parallel']} running, "
+                 f"{queue['interactive_waiting']} chat and {queue['bulk_waiting']} summary requests waiting")
+    if keep_warm.last_load is not None:
+        at, seconds, error = keep_warm.last_load
+        result = f"failed ({error})" if error else f"took {seconds:.1f} s"
+        lines.append(f"**Last warm-up:** {at.strftime('%I:%M %p')} ET, {result}")
+    lines.append(f"**Keep-warm hours:** {keep_warm.KEEP_WARM_HOURS or 'off'}" + (" ET" if keep_warm.KEEP_WARM_RANGES else ""))
+    return "\n".join(lines)
+
 def add_llm_commands(bot, ollama_url, history_limit):
     global OLLAMA_URL, HISTORY_LIMIT
     OLLAMA_URL = ollama_url
     HISTORY_LIMIT = history_limit
 
-    # Helper to trim history by total characters (proxy for tokens)
-    def trim_history_by_chars(history, max_chars=9000):
-        result = []
-        total = 0
-        for msg in reversed(history):
-            msg_str = f"{msg.get('username', 'user')}: {msg.get('content', '')}"
-            if total + len(msg_str) > max_chars:
-                break
-            result.insert(0, msg)
-            total += len(msg_str)
-        return result
-
     @bot.tree.command(name="chat", description="Chat with the llama")
     @app_commands.describe(message="Your message to the llama")
     async def chat(interaction: discord.Interaction, message: str):
         await interaction.response.defer()
         channel_id = interaction.channel_id if interaction.channel_id is not None else 0
-        add_message(channel_id, "user", interaction.user.name, message)
+        question_id = await adb.store_message(channel_id, "user", interaction.user.name, message)
         # Use channel personality if set, else default
-        system_prompt = get_channel_personality(channel_id) or "You are a helpful assistant. Answer the user's request directly and concisely."
-<<<<<<< HEAD
-        # Fetch recent message history for context (reduced to 5 messages to avoid confusion)
-        history = get_history(channel_id, limit=5)
-        # Strong instruction so model answers only the latest user message
-        guard = (
-            "Important: Use the conversation history only for context. "
-            "Answer ONLY the user's most recent message below. Do NOT repeat, summarize, or respond to earlier messages unless explicitly asked."
-        )
-        # Build a compact history block (context only)
-        history_items = history[:-1]  # skip the last entry which is the current message we just stored
-        history_text = ""
-        for msg in history_items:
-            if msg['role'] == 'user':
-                history_text += f"USER ({msg.get('username','user')}): {msg.get('content','')}\n"
-            else:
-                history_text += f"ASSISTANT: {msg.get('content','')}\n"
-        # System prompt with guard followed by a single system message containing the context
-        llm_prompt = [{"role": "system", "content": system_prompt + "\n\n" + guard}]
-        if history_text:
-            llm_prompt.append({"role": "system", "content": "Conversation history (context only):\n" + history_text})
-        # Add current message as the single user turn the LLM should answer
-=======
-        # Fetch recent message history for context
-        history = get_history(channel_id, limit=20)
-        llm_prompt = [{"role": "system", "content": system_prompt}]
-        # Add conversation history (excluding the message we just added)
-        for msg in history[:-1]:  # Skip the last message since that's the one we just added
-            if msg['role'] == 'user':
-                llm_prompt.append({"role": "user", "content": f"{msg['username']}: {msg['content']}"})
-            else:
-                llm_prompt.append({"role": "assistant", "content": msg['content']})
-        # Trim history by character count to stay within limits
-        llm_prompt = trim_history_by_chars(llm_prompt, max_chars=9000)
-        # Add current message
->>>>>>> 83041854d4debc7a33a75d225530313f7bde20b9
-        llm_prompt.append({"role": "user", "content": f"{interaction.user.name}: {message}"})
-        try:
-            response = await asyncio.to_thread(ask_ollama, llm_prompt, OLLAMA_URL)
-        except Exception as e:
-            response = f"Error: {e}"
-        response = fix_mojibake(response)
-        add_message(channel_id, "assistant", bot.user.name, response)
-        await interaction.followup.send(response)
+        system_prompt = await adb.get_channel_personality(channel_id) or "You are a helpful assistant. Answer the user's request directly and concisely."
+        # Continue the channel's session (cache-friendly prompt), streaming the reply as it comes in
+        response = await chat_sessions.reply(channel_id, question_id, system_prompt, interaction.user.name, message,
+                                             OLLAMA_URL, InteractionTarget(interaction))
+        if response is not None:  # shed and failed replies are not kept
+            await adb.queue_message(channel_id, "assistant", bot.user.name, response)
 
     @bot.tree.command(name="tldr", description="Summarize everything since you last sent a message in this channel")
     async def tldr(interaction: discord.Interaction):
         channel_id = interaction.channel_id if interaction.channel_id is not None else 0
         username = interaction.user.name
-        messages = get_messages_after_user_last(channel_id, username)
+        messages = await adb.get_messages_after_user_last(channel_id, username)
         if not messages:
             await interaction.response.send_message("No new messages since your last message.")
             return
-        # Use channel personality if set, else default
-        system_prompt = get_channel_personality(channel_id) or "Summarize the following conversation for me. Be concise and to the point. 50 words or less please."
-        summary_prompt = [{
-            "role": "system",
-            "content": system_prompt
-        }] + messages
         await interaction.response.defer()
-        summary = ask_ollama(summary_prompt, OLLAMA_URL)
-        summary = re.sub(r'<think>.*?</think>', '', summary, flags=re.DOTALL)
-        summary = re.sub(r'<think>|</think>', '', summary)
-        summary = summary.strip()
-        summary = fix_mojibake(summary)
-        if len(summary) > 1900:
-            summary = summary[:1900] + "..."
-        await interaction.followup.send(f"**TL;DR:**\n{summary}")
+        # Whole days you missed are covered by their stored daily summaries
+        messages = await daily_summaries.with_day_summaries(channel_id, messages)
+        text = await _condensed_text(interaction, channel_id, _single_chunk(messages))
+        if not text:
+            return
+        # Use channel personality if set, else default
+        system_prompt = await adb.get_channel_personality(channel_id) or "Summarize the following conversation for me. Be concise and to the point. 50 words or less please."
+        summary_prompt = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": text}
+        ]
+        await scheduled_reply(summary_prompt, OLLAMA_URL, channel_id, InteractionTarget(interaction),
+                              prefix="**TL;DR:**\n")
 
     @bot.tree.command(name="summarize", description="Summarize all messages in this channel for a given timeframe (today, yesterday, this_month, all)")
     @app_commands.describe(timeframe="Timeframe to summarize: today, yesterday, this_month, or all")
@@ -115,25 +152,42 @@ def add_llm_commands(bot, ollama_url, history_limit):
         if timeframe not in valid_timeframes:
             await interaction.response.send_message("Please provide a valid timeframe: today, yesterday, this_month, or all.")
             return
-        messages = get_messages_for_timeframe(channel_id, timeframe)
-        if not messages:
-            await interaction.response.send_message(f"No messages found for timeframe '{timeframe}'.")
+        await interaction.response.defer()
+        if timeframe in ("this_month", "all"):
+            # Closed days come from their stored daily summaries (at most DAILY_SUMMARY_MAX_PER_COMMAND
+            # new ones are written now); days without one are read raw like today, many days per prompt
+            today = db.today_local()
+            first_day = today.replace(day=1) if timeframe == "this_month" else None
+
+            async def days_progress(days_done):
+                await _edit_progress(interaction, f"⏳ Summarized {days_done:,} new days of the conversation so far...")
+            try:
+                days, raw_days = await daily_summaries.day_summaries(channel_id, first_day, today, OLLAMA_URL, days_progress)
+            except (llm_scheduler.QueueFull, RuntimeError) as e:
+                await InteractionTarget(interaction).follow_up(_condense_error(e))
+                return
+            message_chunks = _chained(daily_summaries.window_chunks(channel_id, days, raw_days),
+                                      adb.stream_messages_for_timeframe(channel_id, "today"))
+        else:
+            message_chunks = adb.stream_messages_for_timeframe(channel_id, timeframe)
+        # Long windows are summarized in chunks first, then the chunk summaries are combined
+        text = await _condensed_text(interaction, channel_id, message_chunks)
+        if text is None:
+            return
+        if not text:
+            await InteractionTarget(interaction).follow_up(f"No messages found for timeframe '{timeframe}'.")
             return
         # Use channel personality if set, else default
-        system_prompt = get_channel_personality(channel_id) or f"Summarize the following conversation for the timeframe '{timeframe}'. Be concise and to the point. 500 words or less."
-        summary_prompt = [{
-            "role": "system",
-            "content": system_prompt
-        }] + messages
-        await interaction.response.defer()
-        summary = await asyncio.to_thread(ask_ollama, summary_prompt, OLLAMA_URL)
-        summary = re.sub(r'<think>.*?</think>', '', summary, flags=re.DOTALL)
-        summary = re.sub(r'<think>|</think>', '', summary)
-        summary = summary.strip()
-        summary = fix_mojibake(summary)
-        if len(summary) > 1900:
-            summary = summary[:1900] + "..."
-        await interaction.followup.send(f"**Summary for {timeframe}:**\n{summary}")
+        system_prompt = await adb.get_channel_personality(channel_id) or f"Summarize the following conversation for the timeframe '{timeframe}'. Be concise and to the point. 500 words or less."
+        summary_prompt = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": text}
+        ]
+        # Summaries are bulk work: chat and mentions go first. Yesterday can't change
+        # any more, so everyone asking for it gets the same (cached) summary.
+        await scheduled_reply(summary_prompt, OLLAMA_URL, channel_id, InteractionTarget(interaction),
+                              priority=llm_scheduler.BULK, prefix=f"**Summary for {timeframe}:**\n",
+                              cache=timeframe == "yesterday")
 
     @bot.tree.command(name="setpersonality", description="Set the chatbot personality for this channel (admin only)")
     @app_commands.describe(personality="The new personality prompt for the chatbot in this channel.")
@@ -147,24 +201,28 @@ def add_llm_commands(bot, ollama_url, history_limit):
             await interaction.response.send_message("You are not authorized to set the personality.")
             return
         channel_id = interaction.channel_id if interaction.channel_id is not None else 0
-        set_channel_personality(channel_id, personality)
+        await adb.set_channel_personality(channel_id, personality)
         await interaction.response.send_message(f"Personality for this channel set to: '{personality}'")
 
+    @bot.tree.command(name="llm_status", description="Show which models Ollama has loaded, their memory use and the request queue")
+    async def llm_status(interaction: discord.Interaction):
+        await interaction.response.defer()
+        try:
+            models = await loaded_models(OLLAMA_URL)
+        except Exception as e:
+            print("Error reading Ollama status:", e)
+            models = None
+        await interaction.followup.send(_llm_status_text(models))
+
     @bot.tree.context_menu(name="ELI5 (Explain Like I'm 5)")
     async def eli5(interaction: discord.Interaction, message: discord.Message):
         await interaction.response.defer()
         channel_id = interaction.channel_id if interaction.channel_id is not None else 0
         # Use channel personality if set, else default
-        system_prompt = get_channel_personality(channel_id) or "Explain the following message as if you are talking to a 5-year-old. Use simple words and keep it short."
+        system_prompt = await adb.get_channel_personality(channel_id) or "Explain the following message as if you are talking to a 5-year-old. Use simple words and keep it short."
         prompt = [
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": message.content}
         ]
-        explanation = ask_ollama(prompt, OLLAMA_URL)
-        explanation = re.sub(r'<think>.*?</think>', '', explanation, flags=re.DOTALL)
-        explanation = re.sub(r'<think>|</think>', '', explanation)
-        explanation = explanation.strip()
-        explanation = fix_mojibake(explanation)
-        if len(explanation) > 1900:
-            explanation = explanation[:1900] + "..."
-        await interaction.followup.send(f"**Original message:**\n> {message.content}\n\n**ELI5:**\n{explanation}", ephemeral=True)
+        await scheduled_reply(prompt, OLLAMA_URL, channel_id, InteractionTarget(interaction, ephemeral=True),
+                              prefix=f"**Original message:**\n> {message.content}\n\n**ELI5:**\n", cache=True)
@@ -0,0 +1,51 @@
+# Content-addressed cache for deterministic LLM requests (ELI5, summaries of closed windows)
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+import adb
+import db
+
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "256"))  # in memory
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))  # seconds
+LLM_CACHE_PERSIST = os.getenv("LLM_CACHE_PERSIST", "1") == "1"  # also keep entries in SQLite
+LLM_CACHE_PERSIST_MAX_ENTRIES = int(os.getenv("LLM_CACHE_PERSIST_MAX_ENTRIES", "5000"))
+
+_entries = OrderedDict()  # key -> (stored_at, response), least recently used first
+
+def cache_key(model: str, messages, options: dict | None = None) -> str:
+    """
+    sha256 over the model, its options and the messages with whitespace
+    normalized, so trivially different prompts share an entry.
+    """
+    normalized = [(m.get("role", ""), " ".join((m.get("content") or "").split())) for m in messages]
+    blob = json.dumps([model, options or {}, normalized], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+def _remember(key: str, stored_at: float, response: str):
+    _entries[key] = (stored_at, response)
+    _entries.move_to_end(key)
+    while len(_entries) > LLM_CACHE_MAX_ENTRIES:
+        _entries.popitem(last=False)
+
+async def get(key: str) -> str | None:
+    entry = _entries.get(key)
+    if entry is not None:
+        if time.time() - entry[0] < LLM_CACHE_TTL:
+            _entries.move_to_end(key)
+            return entry[1]
+        del _entries[key]
+    if not LLM_CACHE_PERSIST:
+        return None
+    row = await adb.run(db.get_cached_response, key, LLM_CACHE_TTL)
+    if row is None:
+        return None
+    response, stored_at = row
+    _remember(key, stored_at, response)
+    return response
+
+async def put(key: str, response: str):
+    _remember(key, time.time(), response)
+    if LLM_CACHE_PERSIST:
+        await adb.run(db.set_cached_response, key, response, LLM_CACHE_TTL, LLM_CACHE_PERSIST_MAX_ENTRIES)
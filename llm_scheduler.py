@@ -0,0 +1,136 @@
+# Central queue in front of Ollama: bounded parallelism, priorities and per-channel fairness
+import asyncio
+import os
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+
+OLLAMA_NUM_PARALLEL = int(os.getenv("OLLAMA_NUM_PARALLEL", "1"))  # match the Ollama server setting
+LLM_QUEUE_MAX = int(os.getenv("LLM_QUEUE_MAX", "20"))  # waiting interactive requests before shedding
+LLM_BULK_QUEUE_MAX = int(os.getenv("LLM_BULK_QUEUE_MAX", "30"))  # waiting bulk requests before shedding
+
+INTERACTIVE = 0  # chat, mentions, ELI5, /tldr
+BULK = 1  # summaries
+
+class QueueFull(Exception):
+    """Raised instead of queueing when too many requests are already waiting."""
+
+class _Ticket:
+    def __init__(self, channel_id: int, priority: int, on_queued):
+        self.channel_id = channel_id
+        self.priority = priority
+        self.on_queued = on_queued
+        self.position = None
+        self.granted = asyncio.get_running_loop().create_future()
+
+_in_flight = 0
+_reports = set()  # running position reports; the loop only keeps weak references to tasks
+# priority -> channel_id -> waiting tickets; channels are served round-robin in dict order
+_waiting = {INTERACTIVE: OrderedDict(), BULK: OrderedDict()}
+
+def _queued(priority: int) -> int:
+    return sum(len(tickets) for tickets in _waiting[priority].values())
+
+def _dispatch_order() -> list:
+    # Every waiting ticket in the order it will be served
+    order = []
+    for priority in (INTERACTIVE, BULK):
+        lanes = [list(tickets) for tickets in _waiting[priority].values()]
+        for depth in range(max((len(lane) for lane in lanes), default=0)):
+            order.extend(lane[depth] for lane in lanes if depth < len(lane))
+    return order
+
+def _pop_next():
+    for priority in (INTERACTIVE, BULK):
+        channels = _waiting[priority]
+        if not channels:
+            continue
+        channel_id, tickets = next(iter(channels.items()))
+        ticket = tickets.popleft()
+        # This channel goes to the back of the line
+        del channels[channel_id]
+        if tickets:
+            channels[channel_id] = tickets
+        return ticket
+    return None
+
+def _remove(ticket: _Ticket):
+    tickets = _waiting[ticket.priority].get(ticket.channel_id)
+    if tickets and ticket in tickets:
+        tickets.remove(ticket)
+        if not tickets:
+            del _waiting[ticket.priority][ticket.channel_id]
+
+def _notify_positions():
+    for position, ticket in enumerate(_dispatch_order(), start=1):
+        if ticket.on_queued is not None and ticket.position != position:
+            ticket.position = position
+            task = asyncio.create_task(_report(ticket.on_queued, position))
+            _reports.add(task)
+            task.add_done_callback(_reports.discard)
+
+async def _report(on_queued, position: int):
+    try:
+        await on_queued(position)
+    except Exception as e:
+        print("Error reporting queue position:", e)
+
+def _dispatch():
+    global _in_flight
+    while _in_flight < OLLAMA_NUM_PARALLEL:
+        ticket = _pop_next()
+        if ticket is None:
+            break
+        if ticket.granted.done():
+            continue
+        _in_flight += 1
+        ticket.granted.set_result(None)
+    _notify_positions()
+
+@asynccontextmanager
+async def slot(channel_id: int, priority: int = INTERACTIVE, on_queued=None):
+    """
+    Holds one of the OLLAMA_NUM_PARALLEL model slots for the duration of the
+    block. Interactive requests are served before bulk ones, and channels take
+    turns within a priority. While waiting, `on_queued(position)` is awaited
+    whenever the caller's place in line changes. Raises QueueFull when the
+    queue for this priority is already at its limit.
+    """
+    global _in_flight
+    if _in_flight < OLLAMA_NUM_PARALLEL and not _dispatch_order():
+        _in_flight += 1
+    else:
+        limit = LLM_QUEUE_MAX if priority == INTERACTIVE else LLM_BULK_QUEUE_MAX
+        if _queued(priority) >= limit:
+            raise QueueFull()
+        ticket = _Ticket(channel_id, priority, on_queued)
+        _waiting[priority].setdefault(channel_id, deque()).append(ticket)
+        _notify_positions()
+        try:
+            await ticket.granted
+        except asyncio.CancelledError:
+            if ticket.granted.done() and not ticket.granted.cancelled():
+                # Granted just as we were cancelled: hand the slot on
+                _in_flight -= 1
+            else:
+                _remove(ticket)
+            _dispatch()
+            raise
+    try:
+        yield
+    finally:
+        _in_flight -= 1
+        _dispatch()
+
+def close():
+    # Call once on shutdown
+    for task in list(_reports):
+        task.cancel()
+
+def status() -> dict:
+    # Snapshot for diagnostics
+    return {
+        "in_flight": _in_flight,
+        "parallel": OLLAMA_NUM_PARALLEL,
+        "interactive_waiting": _queued(INTERACTIVE),
+        "bulk_waiting": _queued(BULK),
+    }
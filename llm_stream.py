@@ -0,0 +1,172 @@
+# Shows a streamed LLM reply in Discord while it is being generated
+import asyncio
+import os
+import time
+import llm_cache
+import llm_scheduler
+from ollama_client import OLLAMA_MODEL, OLLAMA_OPTIONS, StreamError, interaction_expired, interaction_time_left, stream_ollama
+from util import fix_mojibake
+
+STREAM_EDIT_SECONDS = float(os.getenv("STREAM_EDIT_SECONDS", "1.0"))  # min gap between edits
+DISCORD_MESSAGE_LIMIT = 2000
+
+def split_message(text: str, limit: int = DISCORD_MESSAGE_LIMIT) -> list[str]:
+    """
+    Splits text into pieces of at most `limit` characters, preferring to break
+    at a newline, then at a space. A page's break point only depends on the
+    text before it, so pages don't shift while the text keeps growing.
+    """
+    pages = []
+    while len(text) > limit:
+        # Only break early in the second half of a page, so pages don't come out tiny
+        cut = text.rfind("\n", limit // 2, limit)
+        if cut < 0:
+            cut = text.rfind(" ", limit // 2, limit)
+        if cut < 0:
+            cut = limit
+        pages.append(text[:cut])
+        text = text[cut:].lstrip()
+    pages.append(text)
+    return pages
+
+class InteractionTarget:
+    """
+    Answers a deferred interaction: the first page replaces the "thinking" message.
+    Once the interaction has expired (long summaries can outlive it), a public
+    answer goes to the channel as a normal message instead.
+    """
+    def __init__(self, interaction, ephemeral: bool = False):
+        self.interaction = interaction
+        self.ephemeral = ephemeral
+        self.answered = False
+
+    def _to_channel(self) -> bool:
+        return not self.ephemeral and interaction_expired(self.interaction)
+
+    async def send(self, text):
+        self.answered = True
+        if self._to_channel():
+            return await self.interaction.channel.send(text)
+        return await self.interaction.edit_original_response(content=text)
+
+    async def follow_up(self, text):
+        if self._to_channel():
+            return await self.interaction.channel.send(text)
+        return await self.interaction.followup.send(text, wait=True, ephemeral=self.ephemeral)
+
+    async def on_queued(self, position: int):
+        # Position updates run as separate tasks; never let one overwrite the answer
+        if not self.answered and not interaction_expired(self.interaction):
+            await self.interaction.edit_original_response(content=queue_message(position))
+
+    def time_left(self) -> float | None:
+        # A reply that goes to the channel has no interaction deadline
+        return None if self._to_channel() else interaction_time_left(self.interaction)
+
+class MessageTarget:
+    """Replies to a chat message; a queue notice, if one was posted, becomes the reply."""
+    def __init__(self, message):
+        self.message = message
+        self.answered = False
+        self._notice = None
+        self._lock = asyncio.Lock()
+
+    async def _post(self, text):
+        if self._notice is not None:
+            await self._notice.edit(content=text)
+            return self._notice
+        try:
+            return await self.message.reply(text)
+        except Exception:
+            return await self.message.channel.send(text)
+
+    async def send(self, text):
+        async with self._lock:
+            self.answered = True
+            return await self._post(text)
+
+    async def follow_up(self, text):
+        return await self.message.channel.send(text)
+
+    async def on_queued(self, position: int):
+        # Position updates run as separate tasks; never let one overwrite the answer
+        async with self._lock:
+            if not self.answered:
+                self._notice = await self._post(queue_message(position))
+
+    def time_left(self) -> float | None:
+        return None
+
+def queue_message(position: int) -> str:
+    return f"⏳ The llama is busy, you're #{position} in line..."
+
+async def stream_reply(pieces, target, prefix: str = "") -> str:
+    """
+    Posts the reply produced by the async iterator `pieces` as soon as there is
+    visible text, then edits it in place at most every STREAM_EDIT_SECONDS.
+    Text past Discord's limit continues in further messages (target.follow_up).
+    Returns the full reply text.
+    """
+    reply = ""
+    sent = []  # [(message, content shown)]
+    last_edit = 0.0
+
+    async def render():
+        text = fix_mojibake(reply.strip())
+        if not text:
+            return
+        for i, page in enumerate(split_message(prefix + text)):
+            if i < len(sent):
+                message, shown = sent[i]
+                if shown != page:
+                    await message.edit(content=page)
+                    sent[i] = (message, page)
+            else:
+                message = await (target.send if i == 0 else target.follow_up)(page)
+                sent.append((message, page))
+
+    async for piece in pieces:
+        reply += piece
+        if time.monotonic() - last_edit >= STREAM_EDIT_SECONDS:
+            await render()
+            if sent:
+                last_edit = time.monotonic()
+    await render()
+    if not sent:
+        await target.send(prefix + "No response from the llama.")
+    return fix_mojibake(reply.strip())
+
+async def scheduled_reply(messages, ollama_url, channel_id: int, target, priority: int = llm_scheduler.INTERACTIVE,
+                          prefix: str = "", cache: bool = False) -> str | None:
+    """
+    Waits for a model slot from llm_scheduler (showing the queue position on
+    the target), then streams the reply into it. Returns the reply text, or
+    None when the request was shed because the queue is full. With cache set,
+    an identical earlier request is answered from llm_cache without the model,
+    and a successful reply is stored for next time.
+    """
+    key = llm_cache.cache_key(OLLAMA_MODEL, messages, OLLAMA_OPTIONS) if cache else None
+    if key is not None:
+        cached = await llm_cache.get(key)
+        if cached is not None:
+            return await stream_reply(_once(cached), target, prefix)
+    failed = False
+
+    async def pieces():
+        nonlocal failed
+        async for piece in stream_ollama(messages, ollama_url, timeout=target.time_left()):
+            failed = failed or isinstance(piece, StreamError)
+            yield piece
+
+    try:
+        async with llm_scheduler.slot(channel_id, priority, target.on_queued):
+            reply = await stream_reply(pieces(), target, prefix)
+    except llm_scheduler.QueueFull:
+        await target.send("🦙 The llama is swamped right now. Please try again in a minute.")
+        return None
+    if key is not None and reply and not failed:
+        await llm_cache.put(key, reply)
+    return reply
+
+async def _once(text: str):
+    yield text
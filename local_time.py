@@ -0,0 +1,18 @@
+# The bot's notion of a day: Eastern calendar days over UTC message timestamps.
+# Shared by db.py and the migrations so stored rollups and queries never disagree.
+from datetime import date, datetime, timezone
+
+try:
+    from zoneinfo import ZoneInfo
+    EASTERN = ZoneInfo('America/New_York')
+except ImportError:
+    import pytz
+    EASTERN = pytz.timezone('America/New_York')
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+def local_date_of(timestamp_utc: str | datetime) -> date:
+    # messages.timestamp (UTC) -> Eastern calendar date
+    if isinstance(timestamp_utc, str):
+        timestamp_utc = datetime.strptime(timestamp_utc[:19], TIMESTAMP_FORMAT).replace(tzinfo=timezone.utc)
+    return timestamp_utc.astimezone(EASTERN).date()
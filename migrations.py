@@ -0,0 +1,323 @@
+# Versioned schema migrations, applied in order at startup
+import sqlite3
+from collections import Counter
+from local_time import local_date_of
+
+def _backfill_message_counts_daily(conn: sqlite3.Connection):
+    # Eastern offsets are whole hours, so hourly UTC buckets map cleanly onto local days
+    counts = Counter()
+    cursor = conn.execute(
+        """
+        SELECT channel_id, username, strftime('%Y-%m-%d %H:00:00', timestamp) AS hour, COUNT(*)
+        FROM messages
+        GROUP BY channel_id, username, hour
+        """
+    )
+    for channel_id, username, hour, n in cursor:
+        if hour is None:
+            continue
+        counts[(channel_id, local_date_of(hour).isoformat(), username)] += n
+    conn.executemany(
+        "INSERT INTO message_counts_daily (channel_id, local_date, username, count) VALUES (?, ?, ?, ?)",
+        [key + (n,) for key, n in counts.items()]
+    )
+
+# Each migration is (version, description, steps). A step is either an SQL
+# statement or a callable taking the connection, for changes SQL alone can't do.
+# Never edit a migration that has shipped; append a new one instead.
+MIGRATIONS = [
+    (1, "initial schema", [
+        '''
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            channel_id INTEGER,
+            role TEXT,
+            username TEXT,
+            content TEXT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        # Track last imported message per channel
+        '''
+        CREATE TABLE IF NOT EXISTS import_state (
+            channel_id INTEGER PRIMARY KEY,
+            last_message_id INTEGER
+        )
+        ''',
+        # Track TV show recommendations
+        '''
+        CREATE TABLE IF NOT EXISTS recommendations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL UNIQUE
+        )
+        ''',
+        # Track which users have watched which recommendations
+        '''
+        CREATE TABLE IF NOT EXISTS recommendations_watched (
+            recommendation_id INTEGER,
+            username TEXT,
+            PRIMARY KEY (recommendation_id, username),
+            FOREIGN KEY (recommendation_id) REFERENCES recommendations(id)
+        )
+        ''',
+        # Hall of Fame Quotes table
+        '''
+        CREATE TABLE IF NOT EXISTS quotes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            channel_id INTEGER,
+            message_id INTEGER,
+            username TEXT,
+            content TEXT,
+            quoted_by TEXT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        # Channel personalities table
+        '''
+        CREATE TABLE IF NOT EXISTS channel_personalities (
+            channel_id INTEGER PRIMARY KEY,
+            personality TEXT
+        )
+        ''',
+        # Track user all-time high (ATH) events
+        '''
+        CREATE TABLE IF NOT EXISTS user_ath (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            last_ath DATETIME
+        )
+        ''',
+    ]),
+    (2, "message and quote lookup indexes", [
+        "CREATE INDEX IF NOT EXISTS idx_messages_channel_id ON messages (channel_id, id)",
+        "CREATE INDEX IF NOT EXISTS idx_messages_channel_timestamp ON messages (channel_id, timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_messages_channel_username_id ON messages (channel_id, username, id)",
+        "CREATE INDEX IF NOT EXISTS idx_quotes_channel_id ON quotes (channel_id, id)",
+        "ANALYZE",
+    ]),
+    (3, "full-text search index on message content", [
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+            content,
+            content='messages',
+            content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+        """,
+        # Keep the index in sync with the messages table
+        """
+        CREATE TRIGGER IF NOT EXISTS messages_fts_ai AFTER INSERT ON messages BEGIN
+            INSERT INTO messages_fts (rowid, content) VALUES (new.id, new.content);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS messages_fts_ad AFTER DELETE ON messages BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS messages_fts_au AFTER UPDATE OF content ON messages BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+            INSERT INTO messages_fts (rowid, content) VALUES (new.id, new.content);
+        END
+        """,
+        # Backfill everything stored before the index existed
+        "INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')",
+    ]),
+    (4, "per-day message count rollup", [
+        """
+        CREATE TABLE IF NOT EXISTS message_counts_daily (
+            channel_id INTEGER,
+            local_date TEXT,
+            username TEXT,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (channel_id, local_date, username)
+        ) WITHOUT ROWID
+        """,
+        _backfill_message_counts_daily,
+    ]),
+    (5, "cold archive for retained-out messages", [
+        # content holds zlib-compressed bytes when that is smaller, plain text otherwise
+        """
+        CREATE TABLE IF NOT EXISTS messages_archive (
+            id INTEGER PRIMARY KEY,
+            channel_id INTEGER,
+            role TEXT,
+            username TEXT,
+            content BLOB,
+            timestamp DATETIME
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_messages_archive_channel_id ON messages_archive (channel_id, id)",
+        "CREATE INDEX IF NOT EXISTS idx_messages_archive_channel_timestamp ON messages_archive (channel_id, timestamp)",
+    ]),
+    (6, "discord message ids on stored messages", [
+        "ALTER TABLE messages ADD COLUMN message_id INTEGER",
+        "ALTER TABLE messages ADD COLUMN author_id INTEGER",
+        "ALTER TABLE messages ADD COLUMN created_at DATETIME",
+        "ALTER TABLE messages_archive ADD COLUMN message_id INTEGER",
+        "ALTER TABLE messages_archive ADD COLUMN author_id INTEGER",
+        "ALTER TABLE messages_archive ADD COLUMN created_at DATETIME",
+        # Older rows have no message_id, so the uniqueness only covers rows that do
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_messages_message_id ON messages (message_id) WHERE message_id IS NOT NULL",
+        "CREATE INDEX IF NOT EXISTS idx_messages_archive_message_id ON messages_archive (message_id) WHERE message_id IS NOT NULL",
+    ]),
+    (7, "reaction ledger", [
+        # One row per (message, reactor, emoji), fed by gateway reaction events
+        """
+        CREATE TABLE IF NOT EXISTS reactions (
+            message_id INTEGER NOT NULL,
+            channel_id INTEGER NOT NULL,
+            author_id INTEGER,
+            author_name TEXT,
+            reactor_id INTEGER NOT NULL,
+            reactor_name TEXT,
+            reactor_bot INTEGER NOT NULL DEFAULT 0,
+            emoji TEXT NOT NULL,
+            message_created_at DATETIME,
+            reacted_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (message_id, reactor_id, emoji)
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_reactions_channel_emoji_created ON reactions (channel_id, emoji, message_created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_reactions_channel_created ON reactions (channel_id, message_created_at)",
+        # Channels whose full history has been crawled into the ledger
+        """
+        CREATE TABLE IF NOT EXISTS reaction_backfill_state (
+            channel_id INTEGER PRIMARY KEY,
+            completed_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ]),
+    (8, "incremental reaction leaderboard checkpoints", [
+        # Partial leaderboard counts per channel and UTC hour, built by history crawls.
+        # metric is 'received' / 'given' (emoji = tracked name, '*' for all emoji),
+        # 'posted' (non-bot authors) or 'messages' (every message, username '')
+        """
+        CREATE TABLE IF NOT EXISTS reaction_scan_buckets (
+            channel_id INTEGER NOT NULL,
+            bucket TEXT NOT NULL,
+            metric TEXT NOT NULL,
+            emoji TEXT NOT NULL DEFAULT '',
+            username TEXT NOT NULL DEFAULT '',
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (channel_id, bucket, metric, emoji, username)
+        ) WITHOUT ROWID
+        """,
+        # The hours [low_bucket, hour of scanned_up_to_id] the buckets cover ('' = from the start)
+        """
+        CREATE TABLE IF NOT EXISTS reaction_scan_state (
+            channel_id INTEGER PRIMARY KEY,
+            low_bucket TEXT NOT NULL,
+            scanned_up_to_id INTEGER,
+            includes_reactors INTEGER NOT NULL DEFAULT 0,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ]),
+    (9, "persistent LLM response cache", [
+        # key is the sha256 of (model, options, normalized messages)
+        """
+        CREATE TABLE IF NOT EXISTS llm_response_cache (
+            key TEXT PRIMARY KEY,
+            response TEXT NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_llm_response_cache_created ON llm_response_cache (created_at)",
+    ]),
+    (10, "rolling daily channel summaries", [
+        # One summary per channel and closed Eastern day; message_count is the rollup
+        # count it was built from, so days that gain messages later get redone
+        """
+        CREATE TABLE IF NOT EXISTS channel_daily_summaries (
+            channel_id INTEGER NOT NULL,
+            local_date TEXT NOT NULL,
+            summary TEXT NOT NULL,
+            message_count INTEGER NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (channel_id, local_date)
+        ) WITHOUT ROWID
+        """,
+    ]),
+    (11, "latest name per user and covering ledger window index", [
+        # Newest name each Discord user id was stored under, so leaderboards can count
+        # by id without scanning history; message and reaction writes keep it current
+        """
+        CREATE TABLE IF NOT EXISTS user_names (
+            user_id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            seen DATETIME
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_user_names_name ON user_names (name)",
+        # SQLite takes the bare name column from the row holding MAX(seen)
+        """
+        INSERT INTO user_names (user_id, name, seen)
+        SELECT user_id, name, MAX(seen) FROM (
+            SELECT author_id AS user_id, author_name AS name, message_created_at AS seen
+                FROM reactions WHERE author_id IS NOT NULL AND author_name IS NOT NULL
+            UNION ALL
+            SELECT reactor_id, reactor_name, reacted_at FROM reactions WHERE reactor_name IS NOT NULL
+            UNION ALL
+            SELECT author_id, username, timestamp FROM messages
+                WHERE role = 'user' AND author_id IS NOT NULL AND username IS NOT NULL
+            UNION ALL
+            SELECT author_id, username, timestamp FROM messages_archive
+                WHERE role = 'user' AND author_id IS NOT NULL AND username IS NOT NULL
+        ) GROUP BY user_id
+        """,
+        # Leaderboard windows filter on (channel_id, message_created_at); with the primary
+        # key columns every index carries, this one covers all the columns they read
+        "CREATE INDEX IF NOT EXISTS idx_reactions_channel_created_users ON reactions (channel_id, message_created_at, author_id, author_name, reactor_bot)",
+        "DROP INDEX IF EXISTS idx_reactions_channel_created",
+        "ANALYZE",
+    ]),
+]
+
+def current_version(conn: sqlite3.Connection) -> int:
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """
+    Brings the database up to the latest schema version and returns it.
+    Each migration runs in its own transaction together with its schema_version
+    row, so a failed step leaves the database at the previous version.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    if conn.in_transaction:
+        conn.commit()
+    version = current_version(conn)
+    for step_version, description, steps in MIGRATIONS:
+        if step_version <= version:
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        if current_version(conn) >= step_version:
+            # Another process applied it while we waited for the lock
+            conn.rollback()
+            version = step_version
+            continue
+        try:
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            conn.execute(
+                "INSERT INTO schema_version (version, description) VALUES (?, ?)",
+                (step_version, description)
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        version = step_version
+        print(f"Applied database migration {step_version}: {description}")
+    return version
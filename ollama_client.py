@@ -1,25 +1,217 @@
+import asyncio
+import json
+import os
 import re
-import requests
+import time
+from datetime import datetime, timedelta, timezone
+import aiohttp
+import prompt
 
-def ask_ollama(messages, ollama_url):
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3")
+# Sent with every request; part of llm_cache keys, since the context size changes answers
+OLLAMA_OPTIONS = {"num_ctx": prompt.context_length(OLLAMA_MODEL)}
+# How long Ollama keeps a model loaded after a request ("30m", "1h", seconds, or -1 = forever).
+# OLLAMA_KEEP_ALIVE_MODELS overrides it per model: "llama3=1h,mistral=10m"
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+OLLAMA_KEEP_ALIVE_MODELS = {
+    name.strip(): value.strip()
+    for name, _, value in (item.partition("=") for item in os.getenv("OLLAMA_KEEP_ALIVE_MODELS", "").split(","))
+    if name.strip() and value.strip()
+}
+OLLAMA_LOAD_TIMEOUT = float(os.getenv("OLLAMA_LOAD_TIMEOUT", "300"))  # seconds, loading a model from disk
+ERROR_PREFIX = "Error contacting the llama"  # start of every error ask_ollama returns
+OLLAMA_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", "90"))  # seconds, per call
+OLLAMA_MAX_CONNECTIONS = int(os.getenv("OLLAMA_MAX_CONNECTIONS", "8"))
+# Discord interaction tokens stop accepting followups after 15 minutes
+INTERACTION_LIFETIME = timedelta(minutes=15)
+INTERACTION_MARGIN_SECONDS = 5
+
+_session = None
+
+def _get_session() -> aiohttp.ClientSession:
+    # One pooled keep-alive session for every call, created on first use inside the event loop
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(limit=OLLAMA_MAX_CONNECTIONS, keepalive_timeout=60)
+        _session = aiohttp.ClientSession(connector=connector)
+    return _session
+
+async def close():
+    # Call once on shutdown
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+def keep_alive_for(model: str):
+    # Ollama accepts durations as strings and plain seconds as numbers
+    value = OLLAMA_KEEP_ALIVE_MODELS.get(model, OLLAMA_KEEP_ALIVE)
+    return int(value) if value.lstrip("-").isdigit() else value
+
+def interaction_time_left(interaction) -> float:
+    """
+    Seconds until the interaction can no longer be answered, to use as the
+    timeout of a request whose reply goes to that interaction.
+    """
+    expires_at = interaction.created_at + INTERACTION_LIFETIME
+    left = (expires_at - datetime.now(timezone.utc)).total_seconds() - INTERACTION_MARGIN_SECONDS
+    return max(1.0, left)
+
+def interaction_expired(interaction) -> bool:
+    # True once edits and followups of the interaction would be rejected
+    return interaction_time_left(interaction) <= 1.0
+
+def _response_content(data) -> str:
+    if 'message' in data:
+        content = data['message'].get('content', 'No response from the llama.')
+    elif 'messages' in data and data['messages']:
+        content = data['messages'][-1].get('content', 'No response from the llama.')
+    else:
+        content = data.get("response", "No response from the llama.")
+    # Remove <think>...</think> or leading <think> tags
+    content = re.sub(r'<think>.*?</think>', '', content, flags=re.DOTALL)
+    content = re.sub(r'^<think>.*', '', content, flags=re.DOTALL)
+    return content.strip()
+
+async def ask_ollama(messages, ollama_url, timeout: float | None = None):
+    """
+    Sends a chat request to Ollama over the shared connection pool and returns
+    the reply text (or an error string). timeout defaults to OLLAMA_TIMEOUT.
+    If the calling task is cancelled the connection is dropped, which makes
+    Ollama stop generating.
+    """
     payload = {
-        "model": "llama3",
+        "model": OLLAMA_MODEL,
         "messages": messages,
-        "stream": False
+        "stream": False,
+        "options": OLLAMA_OPTIONS,
+        "keep_alive": keep_alive_for(OLLAMA_MODEL)
     }
     try:
-        resp = requests.post(f"{ollama_url}/api/chat", json=payload, timeout=90)
+        async with _get_session().post(
+            f"{ollama_url}/api/chat",
+            json=payload,
+            timeout=aiohttp.ClientTimeout(total=timeout or OLLAMA_TIMEOUT)
+        ) as resp:
+            resp.raise_for_status()
+            data = await resp.json(content_type=None)
+        prompt.observe(messages, data.get("prompt_eval_count"))
+        return _response_content(data)
+    except asyncio.TimeoutError:
+        return f"{ERROR_PREFIX}: it took too long to answer."
+    except Exception as e:
+        return f"{ERROR_PREFIX}: {e}"
+
+async def load_model(ollama_url, model: str = OLLAMA_MODEL) -> float:
+    """
+    Loads the model into memory without generating anything (an empty chat
+    request), or just renews its keep_alive if it is already loaded. Returns
+    the seconds it took; raises on failure.
+    """
+    payload = {"model": model, "messages": [], "stream": False, "options": OLLAMA_OPTIONS,
+               "keep_alive": keep_alive_for(model)}
+    started = time.monotonic()
+    async with _get_session().post(
+        f"{ollama_url}/api/chat",
+        json=payload,
+        timeout=aiohttp.ClientTimeout(total=OLLAMA_LOAD_TIMEOUT)
+    ) as resp:
+        resp.raise_for_status()
+        await resp.read()
+    return time.monotonic() - started
+
+async def loaded_models(ollama_url) -> list[dict]:
+    # Models currently in memory, from Ollama's /api/ps (name, size, size_vram, expires_at, ...)
+    async with _get_session().get(
+        f"{ollama_url}/api/ps",
+        timeout=aiohttp.ClientTimeout(total=10)
+    ) as resp:
         resp.raise_for_status()
-        data = resp.json()
-        if 'message' in data:
-            content = data['message'].get('content', 'No response from the llama.')
-        elif 'messages' in data and data['messages']:
-            content = data['messages'][-1].get('content', 'No response from the llama.')
-        else:
-            content = data.get("response", "No response from the llama.")
-        # Remove <think>...</think> or leading <think> tags
-        content = re.sub(r'<think>.*?</think>', '', content, flags=re.DOTALL)
-        content = re.sub(r'^<think>.*', '', content, flags=re.DOTALL)
-        return content.strip()
+        data = await resp.json(content_type=None)
+    return data.get("models") or []
+
+class ThinkFilter:
+    """
+    Drops <think>...</think> blocks from text that arrives in pieces, even when
+    a tag is split across pieces. An unclosed block is dropped entirely.
+    """
+    OPEN, CLOSE = "<think>", "</think>"
+
+    def __init__(self):
+        self._buffer = ""
+        self._inside = False
+
+    def feed(self, text: str) -> str:
+        # Returns the part of the text seen so far that is safe to show
+        self._buffer += text
+        visible = []
+        while True:
+            if self._inside:
+                end = self._buffer.find(self.CLOSE)
+                if end < 0:
+                    self._buffer = self._buffer[-(len(self.CLOSE) - 1):]
+                    break
+                self._buffer = self._buffer[end + len(self.CLOSE):]
+                self._inside = False
+            else:
+                start = self._buffer.find(self.OPEN)
+                if start < 0:
+                    # Hold back what could be the start of an opening tag
+                    keep = next((k for k in range(len(self.OPEN) - 1, 0, -1) if self._buffer.endswith(self.OPEN[:k])), 0)
+                    cut = len(self._buffer) - keep
+                    visible.append(self._buffer[:cut])
+                    self._buffer = self._buffer[cut:]
+                    break
+                visible.append(self._buffer[:start])
+                self._buffer = self._buffer[start + len(self.OPEN):]
+                self._inside = True
+        return "".join(visible).replace(self.CLOSE, "")
+
+    def flush(self) -> str:
+        rest = "" if self._inside else self._buffer
+        self._buffer = ""
+        return rest
+
+class StreamError(str):
+    """Error text yielded by stream_ollama in place of reply text."""
+
+async def stream_ollama(messages, ollama_url, timeout: float | None = None):
+    """
+    Async generator over the reply as Ollama produces it (streaming NDJSON),
+    with <think> blocks already removed. Errors are yielded as StreamError
+    text, like ask_ollama returns them. Closing the generator drops the connection.
+    """
+    payload = {
+        "model": OLLAMA_MODEL,
+        "messages": messages,
+        "stream": True,
+        "options": OLLAMA_OPTIONS,
+        "keep_alive": keep_alive_for(OLLAMA_MODEL)
+    }
+    think = ThinkFilter()
+    try:
+        async with _get_session().post(
+            f"{ollama_url}/api/chat",
+            json=payload,
+            timeout=aiohttp.ClientTimeout(total=timeout or OLLAMA_TIMEOUT)
+        ) as resp:
+            resp.raise_for_status()
+            async for line in resp.content:
+                if not line.strip():
+                    continue
+                data = json.loads(line)
+                if data.get("error"):
+                    raise RuntimeError(data["error"])
+                piece = think.feed(data.get("message", {}).get("content", ""))
+                if piece:
+                    yield piece
+                if data.get("done"):
+                    prompt.observe(messages, data.get("prompt_eval_count"))
+                    break
+        rest = think.flush()
+        if rest:
+            yield rest
+    except asyncio.TimeoutError:
+        yield StreamError(f"\n\n({ERROR_PREFIX}: it took too long to answer.)")
     except Exception as e:
-        return f"Error contacting the llama: {e}"
+        yield StreamError(f"\n\n({ERROR_PREFIX}: {e})")
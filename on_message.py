@@ -8,9 +8,9 @@ from sports.mlb import get_last_mlb_games
 from sports.nfl import get_last_nfl_games
 from sports.nascar import get_last_nascar_cup_winner
 from sports.f1 import get_last_f1_race_winner
-from ollama_client import ask_ollama
-from db import add_message, set_channel_personality, get_channel_personality
-from util import fix_mojibake  # Use the ftfy-based version
+import chat_sessions
+from llm_stream import MessageTarget, scheduled_reply
+import adb
 
 OWNER_USER_ID = int(os.getenv('OWNER_USER_ID', '0'))
 
@@ -37,7 +37,7 @@ def setup_on_message(bot, HISTORY_LIMIT):
                     await message.channel.send('Usage: !setpersonality <personality prompt>')
                 return
             personality = parts[1].strip()
-            set_channel_personality(message.channel.id, personality)
+            await adb.set_channel_personality(message.channel.id, personality)
             try:
                 await message.reply(f"Personality for this channel set to: '{personality}'")
             except Exception:
@@ -96,6 +96,7 @@ def setup_on_message(bot, HISTORY_LIMIT):
         # If the bot is mentioned, treat as a chat request
         if bot.user in message.mentions:
             channel_id = message.channel.id
+            ollama_url = os.getenv('OLLAMA_URL', 'http://plexllm-ollama-1:11434')
             # Remove the mention from the message content
             content = message.content.replace(f'<@{bot.user.id}>', '').strip()
             content = content.lower().strip()
@@ -123,12 +124,7 @@ def setup_on_message(bot, HISTORY_LIMIT):
                             {"role": "system", "content": "You are a helpful sports assistant."},
                             {"role": "user", "content": f"Here are all the MLB scores from yesterday (or the most recent day with games):\n{summary}\nPlease answer the user's question in a short, concise way (2-3 sentences or a simple list). The user's question: {content}"}
                         ]
-                        response = ask_ollama(llm_prompt, os.getenv('OLLAMA_URL', 'http://plexllm-ollama-1:11434'))
-                        response = fix_mojibake(response)
-                        try:
-                            await message.reply(response)
-                        except Exception:
-                            await message.channel.send(response)
+                        await scheduled_reply(llm_prompt, ollama_url, channel_id, MessageTarget(message))
                         return
                 # NBA scores summary if no team mentioned
                 if 'nba' in content and not any(team_mentioned(team, content) for g in get_last_nba_games() for team in g['teams']):
@@ -139,12 +135,7 @@ def setup_on_message(bot, HISTORY_LIMIT):
                             {"role": "system", "content": "You are a helpful sports assistant."},
                             {"role": "user", "content": f"Here are all the NBA scores from yesterday (or the most recent day with games):\n{summary}\nPlease answer the user's question in a short, concise way (2-3 sentences or a simple list). The user's question: {content}"}
                         ]
-                        response = ask_ollama(llm_prompt, os.getenv('OLLAMA_URL', 'http://plexllm-ollama-1:11434'))
-                        response = fix_mojibake(response)
-                        try:
-                            await message.reply(response)
-                        except Exception:
-                            await message.channel.send(response)
+                        await scheduled_reply(llm_prompt, ollama_url, channel_id, MessageTarget(message))
                         return
                 # NFL scores summary if no team mentioned
                 if 'nfl' in content and not any(team_mentioned(team, content) for g in get_last_nfl_games() for team in g['teams']):
@@ -155,12 +146,7 @@ def setup_on_message(bot, HISTORY_LIMIT):
                             {"role": "system", "content": "You are a helpful sports assistant."},
                             {"role": "user", "content": f"Here are all the NFL scores from yesterday (or the most recent day with games):\n{summary}\nPlease answer the user's question in a short, concise way (2-3 sentences or a simple list). The user's question: {content}"}
                         ]
-                        response = ask_ollama(llm_prompt, os.getenv('OLLAMA_URL', 'http://plexllm-ollama-1:11434'))
-                        response = fix_mojibake(response)
-                        try:
-                            await message.reply(response)
-                        except Exception:
-                            await message.channel.send(response)
+                        await scheduled_reply(llm_prompt, ollama_url, channel_id, MessageTarget(message))
                         return
                 # More robust NASCAR Cup winner detection
                 nascar_trigger = (
@@ -179,12 +165,7 @@ def setup_on_message(bot, HISTORY_LIMIT):
                             {"role": "system", "content": "You are a helpful sports assistant. Only repeat the summary provided, do not add extra information or disclaimers."},
                             {"role": "user", "content": f"Here is the result of the most recent NASCAR Cup race: {summary}\nPlease answer the user's question by repeating the summary exactly. The user's question: {content}"}
                         ]
-                        response = ask_ollama(llm_prompt, os.getenv('OLLAMA_URL', 'http://plexllm-ollama-1:11434'))
-                        response = fix_mojibake(response)
-                        try:
-                            await message.reply(response)
-                        except Exception:
-                            await message.channel.send(response)
+                        await scheduled_reply(llm_prompt, ollama_url, channel_id, MessageTarget(message))
                         return
                 if f1_trigger:
                     f1_result = await get_last_f1_race_winner() # type: ignore
@@ -194,74 +175,21 @@ def setup_on_message(bot, HISTORY_LIMIT):
                             {"role": "system", "content": "You are a helpful sports assistant. Only repeat the summary provided, do not add extra information or disclaimers."},
                             {"role": "user", "content": f"Here is the result of the most recent F1 race: {summary}\nPlease answer the user's question by repeating the summary exactly. The user's question: {content}"}
                         ]
-                        response = ask_ollama(llm_prompt, os.getenv('OLLAMA_URL', 'http://plexllm-ollama-1:11434'))
-                        response = fix_mojibake(response)
-                        try:
-                            await message.reply(response)
-                        except Exception:
-                            await message.channel.send(response)
+                        await scheduled_reply(llm_prompt, ollama_url, channel_id, MessageTarget(message))
                         return
                 # ...existing team-specific logic...
             # --- END SPORTS DETECTION ---
-            add_message(channel_id, "user", message.author.name, content)
+            question_id = await adb.store_message(channel_id, "user", message.author.name, content, message.id,
+                                                  message.author.id, message.created_at.strftime('%Y-%m-%d %H:%M:%S'))
             # Use channel personality if set, else default
-            system_prompt = get_channel_personality(channel_id) or "You are a helpful assistant. Answer the user's request directly and concisely."
-            # Import get_history for context
-            from db import get_history
-<<<<<<< HEAD
-            # Fetch recent message history for context (reduced to 5 messages to avoid confusion)
-            history = get_history(channel_id, limit=5)
-            # Strong instruction so model answers only the latest user message
-            guard = (
-                "Important: Use the conversation history only for context. "
-                "Answer ONLY the user's most recent message below. Do NOT repeat, summarize, or respond to earlier messages unless explicitly asked."
-            )
-            # Build a compact history block (context only)
-            history_items = history[:-1]
-            history_text = ""
-            for msg in history_items:
-                if msg['role'] == 'user':
-                    history_text += f"USER ({msg.get('username','user')}): {msg.get('content','')}\n"
-                else:
-                    history_text += f"ASSISTANT: {msg.get('content','')}\n"
-            # System prompt with guard followed by a single system message containing the context
-            llm_prompt = [{"role": "system", "content": system_prompt + "\n\n" + guard}]
-            if history_text:
-                llm_prompt.append({"role": "system", "content": "Conversation history (context only):\n" + history_text})
-            # Add current message as the single user turn the LLM should answer
-=======
-            # Fetch recent message history for context
-            history = get_history(channel_id, limit=20)
-            llm_prompt = [{"role": "system", "content": system_prompt}]
-            # Add conversation history (excluding the message we just added)
-            for msg in history[:-1]:  # Skip the last message since that's the one we just added
-                if msg['role'] == 'user':
-                    llm_prompt.append({"role": "user", "content": f"{msg['username']}: {msg['content']}"})
-                else:
-                    llm_prompt.append({"role": "assistant", "content": msg['content']})
-            # Trim history by character count to stay within limits
-            def trim_history_by_chars(history, max_chars=9000):
-                result = []
-                total = len(history[0]['content'])  # Start with system prompt
-                for msg in reversed(history[1:]):
-                    msg_str = f"{msg.get('content', '')}"
-                    if total + len(msg_str) > max_chars:
-                        break
-                    result.insert(0, msg)
-                    total += len(msg_str)
-                return [history[0]] + result
-            llm_prompt = trim_history_by_chars(llm_prompt, max_chars=9000)
-            # Add current message
->>>>>>> 83041854d4debc7a33a75d225530313f7bde20b9
-            llm_prompt.append({"role": "user", "content": f"{message.author.name}: {content}"})
-            response = ask_ollama(llm_prompt, os.getenv('OLLAMA_URL', 'http://plexllm-ollama-1:11434'))
-            response = fix_mojibake(response)
-            add_message(channel_id, "assistant", bot.user.name, response)
-            try:
-                await message.reply(response)
-            except Exception:
-                await message.channel.send(response)
+            system_prompt = await adb.get_channel_personality(channel_id) or "You are a helpful assistant. Answer the user's request directly and concisely."
+            # Continue the channel's session (cache-friendly prompt), streaming the reply as it comes in
+            response = await chat_sessions.reply(channel_id, question_id, system_prompt, message.author.name, content,
+                                                 ollama_url, MessageTarget(message))
+            if response is not None:  # shed and failed replies are not kept
+                await adb.queue_message(channel_id, "assistant", bot.user.name, response)
             return
         channel_id = message.channel.id
-        add_message(channel_id, "user", message.author.name, message.content)
+        await adb.queue_message(channel_id, "user", message.author.name, message.content,
+                                message.id, message.author.id, message.created_at.strftime('%Y-%m-%d %H:%M:%S'))
         await bot.process_commands(message)
@@ -0,0 +1,107 @@
+# Token budgeting: how much of the model's context a prompt may use, and what fits in it
+import math
+import os
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Context lengths the models were trained with, by name prefix (longest prefix wins)
+MODEL_CONTEXT_LENGTHS = {
+    "llama3": 8192,
+    "llama3.1": 131072,
+    "llama3.2": 131072,
+    "llama3.3": 131072,
+    "llama2": 4096,
+    "mistral": 32768,
+    "mixtral": 32768,
+    "gemma": 8192,
+    "gemma2": 8192,
+    "gemma3": 131072,
+    "phi3": 4096,
+    "qwen2": 32768,
+    "qwen2.5": 32768,
+    "qwen3": 40960,
+    "deepseek-r1": 131072,
+}
+# Context Ollama is asked to allocate (num_ctx); bigger windows cost VRAM, so a model's full length is opt-in
+OLLAMA_NUM_CTX = int(os.getenv("OLLAMA_NUM_CTX", "8192"))
+REPLY_TOKENS = int(os.getenv("REPLY_TOKENS", "1024"))  # kept free for the answer
+MESSAGE_OVERHEAD_TOKENS = 8  # role header and separators the chat template adds per message
+SAFETY_MARGIN = 0.05  # share of the window left unused in case the count is a little low
+
+_encoding = None
+if tiktoken is not None:
+    try:
+        # The llama 3 tokenizer is a tiktoken BPE of the same family; calibration covers the difference
+        _encoding = tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        print("Error loading tokenizer, estimating token counts instead:", e)
+# Ollama's real prompt token count divided by ours, learned from replies
+_scale = 1.0
+
+def context_length(model: str) -> int:
+    # Tokens the model sees per request: OLLAMA_NUM_CTX, capped at what the model supports
+    name = model.split(":")[0].split("/")[-1].lower()
+    known = [prefix for prefix in MODEL_CONTEXT_LENGTHS if name.startswith(prefix)]
+    if not known:
+        return OLLAMA_NUM_CTX
+    return min(OLLAMA_NUM_CTX, MODEL_CONTEXT_LENGTHS[max(known, key=len)])
+
+def _raw_tokens(text: str) -> int:
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    # Rough English average of four characters per token
+    return len(text) / 4
+
+def count_tokens(text: str, calibrated: bool = True) -> int:
+    # Uncalibrated counts never change for the same text, for splitting that has to be repeatable
+    return math.ceil(_raw_tokens(text) * (_scale if calibrated else 1.0))
+
+def message_tokens(message: dict) -> int:
+    return count_tokens(message.get("content") or "") + MESSAGE_OVERHEAD_TOKENS
+
+def observe(messages, prompt_tokens: int | None):
+    """
+    Calibrates count_tokens with the prompt_eval_count Ollama reported for
+    `messages`. Ollama reuses cached prompt prefixes and then reports fewer
+    tokens, so implausibly low samples are ignored.
+    """
+    global _scale
+    if not prompt_tokens:
+        return
+    counted = sum(_raw_tokens(m.get("content") or "") + MESSAGE_OVERHEAD_TOKENS for m in messages)
+    if counted < 100:
+        return
+    ratio = prompt_tokens / counted
+    if 0.5 <= ratio <= 2.0 and ratio >= _scale * 0.8:
+        _scale += 0.2 * (ratio - _scale)
+
+def prompt_budget(model: str, reply_tokens: int = REPLY_TOKENS) -> int:
+    # Tokens a prompt may use so the reply still fits
+    window = context_length(model)
+    return max(256, int(window * (1 - SAFETY_MARGIN)) - min(reply_tokens, window // 2))
+
+def truncate(text: str, max_tokens: int, calibrated: bool = True) -> str:
+    # Keeps the start of text, cut to about max_tokens
+    tokens = count_tokens(text, calibrated)
+    if tokens <= max_tokens:
+        return text
+    return text[:max(0, len(text) * max_tokens // tokens)]
+
+def fit_newest(items: list[str], budget: int, overhead: int = 1) -> list[str]:
+    """
+    The longest run of newest items whose tokens (plus `overhead` each) fit
+    the budget, oldest first. Counts each item once: linear in the number kept.
+    """
+    kept = []
+    used = 0
+    for item in reversed(items):
+        n = count_tokens(item) + overhead
+        if used + n > budget:
+            break
+        kept.append(item)
+        used += n
+    kept.reverse()
+    return kept
@@ -0,0 +1,300 @@
+# Single-pass reaction analytics shared by every leaderboard command
+import asyncio
+import os
+import time
+from collections import Counter, OrderedDict
+from datetime import datetime, timedelta, timezone
+import discord
+import adb
+import db
+from crawler import crawl_history
+
+# Emoji each leaderboard counts, as stored in the reaction ledger (unicode
+# character for standard emoji, name for custom server emoji)
+TRACKED_EMOJI = {
+    "joy": ["😂", "joy", ":joy:"],
+    "thumbsdown": ["👎", "thumbsdown", ":thumbsdown:"],
+    "heart": ["❤️", "heart", ":heart:"],
+    "thumbsup": ["👍", "thumbsup", ":thumbsup:"],
+}
+_TRACKED_BY_KEY = {key: name for name, keys in TRACKED_EMOJI.items() for key in keys}
+
+REACTION_CACHE_TTL = int(os.getenv("REACTION_CACHE_TTL", "300"))  # seconds
+PROGRESS_EVERY_MESSAGES = 100  # one history page; jobs.py throttles the actual edits
+REACTOR_FETCH_CONCURRENCY = int(os.getenv("REACTOR_FETCH_CONCURRENCY", "4"))
+REACTOR_SNAPSHOT_MAX = int(os.getenv("REACTOR_SNAPSHOT_MAX", "50000"))
+# Hours of recent history re-counted on every crawl, since their reactions may still change
+REACTION_RESCAN_HOURS = int(os.getenv("REACTION_RESCAN_HOURS", "48"))
+
+_cache = {}  # (channel_id, window) -> (computed_at, ReactionStats)
+# (message_id, emoji key) -> (reaction count, [(user_id, name, bot)]), least recently used first
+_reactor_snapshots = OrderedDict()
+_checkpoint_locks = {}  # channel_id -> asyncio.Lock serialising checkpoint updates
+
+def emoji_key(emoji) -> str:
+    # Ledger key for a str / Emoji / PartialEmoji
+    if isinstance(emoji, str):
+        return emoji
+    if getattr(emoji, "id", None) is None:
+        return str(emoji)
+    return emoji.name
+
+def tracked_name(emoji) -> str | None:
+    # 'joy', 'heart', ... for tracked emoji, None for everything else
+    return _TRACKED_BY_KEY.get(emoji_key(emoji))
+
+def utc_str(dt):
+    return dt.strftime('%Y-%m-%d %H:%M:%S') if dt else None
+
+def parse_window(days: str):
+    """
+    Turns 'all', 'today', 'yesterday' or a number of days into (after, before)
+    UTC datetimes (either may be None). Raises ValueError for anything else.
+    """
+    days = days.lower()
+    if days == 'all':
+        return None, None
+    today = db.today_local()
+    if days == 'today':
+        return _local_midnight_utc(today), None
+    if days == 'yesterday':
+        return _local_midnight_utc(today - timedelta(days=1)), _local_midnight_utc(today)
+    return datetime.now(timezone.utc) - timedelta(days=int(days)), None
+
+def _local_midnight_utc(local_date):
+    return datetime.strptime(db.local_day_start_str(local_date), '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+
+class ReactorFetcher:
+    """
+    Fetches reactor lists for many reactions concurrently, at most
+    REACTOR_FETCH_CONCURRENCY requests in flight. discord.py's HTTP client
+    already waits on the per-route rate-limit buckets (X-RateLimit-* headers);
+    capping in-flight calls keeps that queue short instead of triggering 429s.
+    A reaction whose count matches the last snapshot is served from memory.
+    """
+    def __init__(self, concurrency: int = REACTOR_FETCH_CONCURRENCY):
+        self._slots = asyncio.Semaphore(concurrency)
+        self._pending = set()
+        self._max_pending = concurrency * 4
+
+    async def _fetch(self, message_id: int, reaction):
+        key = (message_id, emoji_key(reaction.emoji))
+        snapshot = _reactor_snapshots.get(key)
+        if snapshot and snapshot[0] == reaction.count:
+            _reactor_snapshots.move_to_end(key)
+            return reaction, snapshot[1]
+        async with self._slots:
+            users = [(user.id, user.name, user.bot) async for user in reaction.users()]
+        _reactor_snapshots[key] = (reaction.count, users)
+        _reactor_snapshots.move_to_end(key)
+        while len(_reactor_snapshots) > REACTOR_SNAPSHOT_MAX:
+            _reactor_snapshots.popitem(last=False)
+        return reaction, users
+
+    async def submit(self, message_id: int, reaction):
+        """
+        Queues a fetch and returns the (reaction, users) results that have finished
+        so far. Waits for a slot when too many fetches are already outstanding.
+        """
+        self._pending.add(asyncio.create_task(self._fetch(message_id, reaction)))
+        if len(self._pending) < self._max_pending:
+            return []
+        done, self._pending = await asyncio.wait(self._pending, return_when=asyncio.FIRST_COMPLETED)
+        return self._results(done)
+
+    async def drain(self):
+        # Results of everything still outstanding
+        if not self._pending:
+            return []
+        done, self._pending = await asyncio.wait(self._pending)
+        return self._results(done)
+
+    @staticmethod
+    def _results(done):
+        results = []
+        for task in done:
+            try:
+                results.append(task.result())
+            except Exception:
+                # Same as before: a reaction we can't list is skipped
+                continue
+        return results
+
+class ReactionStats:
+    """
+    Everything the leaderboards need for one channel and window:
+    received[emoji][author] and given[emoji][reactor] for each tracked emoji,
+    given_total[reactor] over all emoji (bots excluded from given counts),
+    the non-bot users who posted, and how many messages were looked at.
+    """
+    def __init__(self, source: str = "crawl"):
+        self.received = {name: Counter() for name in TRACKED_EMOJI}
+        self.given = {name: Counter() for name in TRACKED_EMOJI}
+        self.given_total = Counter()
+        self.posters = set()
+        self.reactors = set()
+        self.message_count = 0
+        self.includes_reactors = False
+        self.source = source
+
+    def footer(self, complete_history: bool = False) -> str:
+        if self.source == "ledger":
+            return f"\n\n📊 From the reaction ledger ({self.message_count:,} messages with reactions)"
+        footer = f"\n\n📊 Analyzed {self.message_count:,} messages"
+        if complete_history:
+            footer += " (complete channel history)"
+        return footer
+
+async def stats_from_ledger(channel_id: int, after, before) -> ReactionStats:
+    start, end = utc_str(after), utc_str(before)
+    summary = await adb.reaction_summary(channel_id, start, end)
+    stats = ReactionStats(source="ledger")
+    stats.includes_reactors = True
+    for emoji, author_name, count in summary["received"]:
+        name = _TRACKED_BY_KEY.get(emoji)
+        if name:
+            stats.received[name][author_name] += count
+    for emoji, reactor_name, count in summary["given"]:
+        name = _TRACKED_BY_KEY.get(emoji)
+        if name:
+            stats.given[name][reactor_name] += count
+        stats.given_total[reactor_name] += count
+        stats.reactors.add(reactor_name)
+    stats.posters = await adb.active_usernames(channel_id, start, end)
+    stats.message_count = summary["messages"]
+    return stats
+
+def hour_bucket(dt) -> str:
+    # Checkpoint bucket (UTC hour) a datetime falls in
+    return dt.strftime('%Y-%m-%d %H:00:00')
+
+def _bucket_start(bucket: str):
+    return datetime.strptime(bucket, '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc) if bucket else None
+
+def stats_from_buckets(rows, includes_reactors: bool) -> ReactionStats:
+    # Builds ReactionStats from summed (metric, emoji, username, count) bucket rows
+    stats = ReactionStats()
+    stats.includes_reactors = includes_reactors
+    for metric, emoji, username, count in rows:
+        if metric == 'received' and emoji in stats.received:
+            stats.received[emoji][username] += count
+        elif metric == 'given':
+            stats.reactors.add(username)
+            if emoji == '*':
+                stats.given_total[username] += count
+            elif emoji in stats.given:
+                stats.given[emoji][username] += count
+        elif metric == 'posted':
+            stats.posters.add(username)
+        elif metric == 'messages':
+            stats.message_count += count
+    return stats
+
+async def scan_buckets(channel, after, before, include_reactors: bool, progress=None):
+    """
+    Walks the channel history once (via crawl_history) and counts everything the leaderboards need
+    per UTC hour. Returns (counts, last message id seen), where counts maps
+    (bucket, metric, emoji, username) to a count. Reactor lists cost one extra
+    API call per reaction, so they are only fetched when include_reactors is
+    set, concurrently through a ReactorFetcher. `progress(message_count)` is
+    awaited every PROGRESS_EVERY_MESSAGES messages.
+    """
+    counts = Counter()
+    fetcher = ReactorFetcher()
+    # The fetcher hands back reactions in completion order, so remember each one's bucket
+    reaction_buckets = {}
+
+    def add_reactors(results):
+        for reaction, users in results:
+            bucket = reaction_buckets.pop(id(reaction))
+            name = tracked_name(reaction.emoji)
+            for _, user_name, is_bot in users:
+                if is_bot:
+                    continue
+                counts[(bucket, 'given', '*', user_name)] += 1
+                if name:
+                    counts[(bucket, 'given', name, user_name)] += 1
+
+    seen = 0
+    last_id = None
+    # Buckets don't care about order, so take messages from whichever segment has them
+    async for msg in crawl_history(channel, after, before, ordered=False):
+        seen += 1
+        last_id = max(last_id or 0, msg.id)
+        if progress is not None and seen % PROGRESS_EVERY_MESSAGES == 0:
+            await progress(seen)
+        bucket = hour_bucket(msg.created_at)
+        counts[(bucket, 'messages', '', '')] += 1
+        if not msg.author.bot:
+            counts[(bucket, 'posted', '', msg.author.name)] += 1
+        for reaction in msg.reactions:
+            name = tracked_name(reaction.emoji)
+            if name:
+                counts[(bucket, 'received', name, msg.author.name)] += reaction.count
+            if include_reactors:
+                reaction_buckets[id(reaction)] = bucket
+                add_reactors(await fetcher.submit(msg.id, reaction))
+    add_reactors(await fetcher.drain())
+    return counts, last_id
+
+async def _advance_checkpoint(channel, low: str, include_reactors: bool, progress=None) -> bool:
+    """
+    Makes the channel's stored buckets cover [low, now): crawls only what the
+    checkpoint doesn't have yet plus the last REACTION_RESCAN_HOURS, whose
+    reaction counts may still change. Returns whether the buckets include
+    reactor lists.
+    """
+    state = await adb.get_reaction_checkpoint(channel.id)
+    if state is None or (include_reactors and not state["includes_reactors"]):
+        # Nothing stored yet (or stored without reactors): count the whole window once
+        counts, last_id = await scan_buckets(channel, _bucket_start(low), None, include_reactors, progress)
+        await adb.save_reaction_scan(channel.id, counts, low, last_id, include_reactors, reset=True)
+        return include_reactors
+    include_reactors = state["includes_reactors"]
+    low_bucket, high_id = state["low_bucket"], state["scanned_up_to_id"]
+    if low < low_bucket:
+        # Window starts before anything stored: add the older hours
+        counts, _ = await scan_buckets(channel, _bucket_start(low), _bucket_start(low_bucket), include_reactors, progress)
+        await adb.save_reaction_scan(channel.id, counts, low, high_id, include_reactors)
+        low_bucket = low
+    rescan_from = datetime.now(timezone.utc) - timedelta(hours=REACTION_RESCAN_HOURS)
+    if high_id:
+        rescan_from = min(rescan_from, discord.utils.snowflake_time(high_id))
+    rescan = max(hour_bucket(rescan_from), low_bucket)
+    counts, last_id = await scan_buckets(channel, _bucket_start(rescan), None, include_reactors, progress)
+    await adb.save_reaction_scan(channel.id, counts, low_bucket, last_id or high_id, include_reactors, replace_from=rescan)
+    return include_reactors
+
+async def checkpointed_stats(channel, after, before, include_reactors: bool, progress=None) -> ReactionStats:
+    """
+    ReactionStats for [after, before) from the channel's stored hourly buckets,
+    after bringing them up to date. Windows are widened to whole hours, so a
+    rolling window may include up to an hour more than asked for.
+    """
+    low = hour_bucket(after) if after else ''
+    lock = _checkpoint_locks.setdefault(channel.id, asyncio.Lock())
+    async with lock:
+        includes_reactors = await _advance_checkpoint(channel, low, include_reactors, progress)
+    rows = await adb.reaction_scan_totals(channel.id, low or None, hour_bucket(before) if before else None)
+    return stats_from_buckets(rows, includes_reactors)
+
+async def get_stats(channel, window: str, after, before, include_reactors: bool = False, progress=None) -> ReactionStats:
+    """
+    ReactionStats for (channel, window): from the ledger when the channel has
+    been backfilled, otherwise from the incremental crawl checkpoints. Results
+    are also kept for REACTION_CACHE_TTL seconds so every leaderboard (and
+    /awards) can reuse them without touching the API.
+    """
+    if await adb.reaction_backfill_done(channel.id):
+        return await stats_from_ledger(channel.id, after, before)
+    key = (channel.id, window.lower())
+    cached = _cache.get(key)
+    if cached and time.monotonic() - cached[0] < REACTION_CACHE_TTL:
+        if cached[1].includes_reactors or not include_reactors:
+            return cached[1]
+    stats = await checkpointed_stats(channel, after, before, include_reactors, progress)
+    _cache[key] = (time.monotonic(), stats)
+    # Drop expired entries so the cache doesn't grow with every window ever asked for
+    for stale in [k for k, (at, _) in _cache.items() if time.monotonic() - at >= REACTION_CACHE_TTL]:
+        del _cache[stale]
+    return stats
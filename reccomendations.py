@@ -2,12 +2,12 @@
 import discord
 from discord import app_commands
 from discord.ext import commands
-import db
+import adb
 
 def add_recommendations_command(bot: commands.Bot):
     @bot.tree.command(name="reccomendations", description="Show group chat recommended TV shows and who has watched them.")
     async def reccomendations_command(interaction: discord.Interaction):
-        recs = db.get_recommendations_with_watchers()
+        recs = await adb.get_recommendations_with_watchers()
         embed = discord.Embed(title="Group TV Show Recommendations", color=discord.Color.blue())
         for rec in recs:
             viewers = ", ".join(rec["watched_by"]) if rec["watched_by"] else "No one yet!"
@@ -17,12 +17,12 @@ def add_recommendations_command(bot: commands.Bot):
     @bot.tree.command(name="addrec", description="Add a new TV show recommendation.")
     @app_commands.describe(title="The title of the TV show to recommend.")
     async def addrec_command(interaction: discord.Interaction, title: str):
-        db.add_recommendation(title)
+        await adb.add_recommendation(title)
         await interaction.response.send_message(f"Added recommendation: {title}")
 
     async def tv_title_autocomplete(interaction: discord.Interaction, current: str):
         # Fetch all TV show titles from the database
-        recs = db.get_recommendations_with_watchers()
+        recs = await adb.get_recommendations_with_watchers()
         # Filter by what the user has typed so far (case-insensitive)
         return [
             app_commands.Choice(name=rec["title"], value=rec["title"])
@@ -35,7 +35,7 @@ def add_recommendations_command(bot: commands.Bot):
     async def watched_command(interaction: discord.Interaction, title: str):
         username = interaction.user.name  # Always use global Discord username for consistency
         try:
-            db.mark_recommendation_watched(title, username)
+            await adb.mark_recommendation_watched(title, username)
             await interaction.response.send_message(f"Marked '{title}' as watched for {username}.")
         except ValueError:
             await interaction.response.send_message(f"Recommendation '{title}' not found.", ephemeral=True)
@@ -0,0 +1,48 @@
+# Background retention: moves old messages out of the hot table into messages_archive
+import asyncio
+import os
+import adb
+import db
+
+RETENTION_MAX_MESSAGES = int(os.getenv("RETENTION_MAX_MESSAGES", "0"))  # per channel, 0 = unlimited
+RETENTION_MAX_DAYS = int(os.getenv("RETENTION_MAX_DAYS", "0"))  # 0 = unlimited
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "500"))
+RETENTION_BATCH_PAUSE_SECONDS = float(os.getenv("RETENTION_BATCH_PAUSE_SECONDS", "0.5"))
+RETENTION_INTERVAL_SECONDS = int(os.getenv("RETENTION_INTERVAL_SECONDS", "3600"))
+
+_task = None
+
+async def run_retention_once() -> int:
+    """
+    Archives everything outside the configured retention window, one small
+    batch (and one short write transaction) at a time. Returns rows moved.
+    """
+    cutoffs = await adb.run(db.archive_cutoffs, RETENTION_MAX_MESSAGES, RETENTION_MAX_DAYS)
+    moved = 0
+    for channel_id, keep_from in cutoffs.items():
+        while True:
+            batch = await adb.run(db.archive_batch, channel_id, keep_from, RETENTION_BATCH_SIZE)
+            moved += batch
+            if batch < RETENTION_BATCH_SIZE:
+                break
+            # Give the chat write path a turn between batches
+            await asyncio.sleep(RETENTION_BATCH_PAUSE_SECONDS)
+    return moved
+
+async def _retention_loop():
+    while True:
+        try:
+            moved = await run_retention_once()
+            if moved:
+                print(f"Archived {moved} old messages")
+        except Exception as e:
+            print("Error archiving old messages:", e)
+        await asyncio.sleep(RETENTION_INTERVAL_SECONDS)
+
+def start_retention():
+    # No-op unless a retention policy is configured
+    global _task
+    if not RETENTION_MAX_MESSAGES and not RETENTION_MAX_DAYS:
+        return
+    if _task is None or _task.done():
+        _task = asyncio.create_task(_retention_loop())
@@ -0,0 +1,136 @@
+# Map-reduce summarization for windows too long to fit in one prompt
+import asyncio
+import os
+import time
+import llm_cache
+import llm_scheduler
+from ollama_client import ERROR_PREFIX, OLLAMA_MODEL, OLLAMA_OPTIONS, ask_ollama
+from prompt import count_tokens, prompt_budget, truncate
+
+# Per prompt; by default half of what fits, leaving room for the instructions and the summary
+SUMMARIZE_CHUNK_TOKENS = int(os.getenv("SUMMARIZE_CHUNK_TOKENS", "0")) or prompt_budget(OLLAMA_MODEL) // 2
+SUMMARIZE_MAX_PARALLEL = int(os.getenv("SUMMARIZE_MAX_PARALLEL", "4"))  # chunk summaries queued at once
+SUMMARIZE_PROGRESS_SECONDS = 5
+
+MAP_PROMPT = (
+    "Summarize this part of a group chat conversation. Keep who said what, decisions, "
+    "plans and memorable moments. 150 words or less."
+)
+REDUCE_PROMPT = (
+    "These are summaries of consecutive parts of one group chat conversation, oldest first. "
+    "Combine them into a single summary that keeps the most important points. 300 words or less."
+)
+
+def format_message(msg) -> str:
+    return f"{msg.get('username') or msg.get('role', 'user')}: {msg.get('content') or ''}"
+
+async def _pack(message_chunks, budget: int):
+    # Joins formatted messages into transcripts of at most `budget` tokens, in order.
+    # Uncalibrated counts keep chunk boundaries (and so cache keys) the same from run to run.
+    lines = []
+    tokens = 0
+    async for chunk in message_chunks:
+        for msg in chunk:
+            line = truncate(format_message(msg), budget, calibrated=False)
+            n = count_tokens(line, calibrated=False)
+            if lines and tokens + n > budget:
+                yield "\n".join(lines)
+                lines, tokens = [], 0
+            lines.append(line)
+            tokens += n
+    if lines:
+        yield "\n".join(lines)
+
+async def summarize_text(channel_id: int, ollama_url: str, instructions: str, text: str) -> str:
+    """
+    One bulk model call through the scheduler. Results are cached by content, so
+    parts of the history that haven't changed are never summarized twice.
+    """
+    prompt = [{"role": "system", "content": instructions}, {"role": "user", "content": text}]
+    key = llm_cache.cache_key(OLLAMA_MODEL, prompt, OLLAMA_OPTIONS)
+    cached = await llm_cache.get(key)
+    if cached is not None:
+        return cached
+    async with llm_scheduler.slot(channel_id, llm_scheduler.BULK):
+        summary = await ask_ollama(prompt, ollama_url)
+    if summary.startswith(ERROR_PREFIX):
+        raise RuntimeError(summary)
+    await llm_cache.put(key, summary)
+    return summary
+
+async def _summarize_all(channel_id: int, ollama_url: str, instructions: str, texts, progress=None) -> list[str]:
+    """
+    Summarizes every text of the (async) iterable concurrently, at most
+    SUMMARIZE_MAX_PARALLEL at a time, and returns the summaries in order.
+    Texts are only pulled from the iterable when a slot is free.
+    """
+    slots = asyncio.Semaphore(SUMMARIZE_MAX_PARALLEL)
+    tasks = []
+    done = 0
+    last_report = time.monotonic()
+
+    async def summarize_one(text):
+        nonlocal done, last_report
+        try:
+            return await summarize_text(channel_id, ollama_url, instructions, text)
+        finally:
+            slots.release()
+            done += 1
+            if progress is not None and time.monotonic() - last_report >= SUMMARIZE_PROGRESS_SECONDS:
+                last_report = time.monotonic()
+                await progress(done)
+
+    try:
+        async for text in texts:
+            await slots.acquire()
+            tasks.append(asyncio.create_task(summarize_one(text)))
+        return list(await asyncio.gather(*tasks))
+    finally:
+        for task in tasks:
+            task.cancel()
+
+async def _aiter(items):
+    for item in items:
+        yield item
+
+def _group(summaries: list[str], budget: int) -> list[str]:
+    # Packs summaries into texts of about `budget` tokens, at least two per text so every round shrinks
+    groups = [[]]
+    tokens = 0
+    for summary in summaries:
+        n = count_tokens(summary, calibrated=False)
+        if len(groups[-1]) >= 2 and tokens + n > budget:
+            groups.append([])
+            tokens = 0
+        groups[-1].append(summary)
+        tokens += n
+    return ["\n\n".join(group) for group in groups]
+
+async def condense(channel_id: int, message_chunks, ollama_url: str, progress=None) -> tuple[str, bool] | None:
+    """
+    Turns a window's messages (an async iterator of message chunks, oldest first)
+    into text that fits one SUMMARIZE_CHUNK_TOKENS prompt. Returns
+    (transcript, False) when the raw conversation already fits, otherwise
+    (partial summaries, True) after summarizing token-bounded chunks in parallel
+    and combining the summaries level by level until they fit. None if there
+    are no messages. `progress(parts_done)` is awaited now and then.
+    """
+    packed = _pack(message_chunks, SUMMARIZE_CHUNK_TOKENS)
+    first = await anext(packed, None)
+    if first is None:
+        return None
+    second = await anext(packed, None)
+    if second is None:
+        return first, False
+
+    async def all_chunks():
+        yield first
+        yield second
+        async for text in packed:
+            yield text
+
+    summaries = await _summarize_all(channel_id, ollama_url, MAP_PROMPT, all_chunks(), progress)
+    while len(summaries) > 1 and sum(count_tokens(s, calibrated=False) for s in summaries) > SUMMARIZE_CHUNK_TOKENS:
+        groups = _group(summaries, SUMMARIZE_CHUNK_TOKENS)
+        summaries = await _summarize_all(channel_id, ollama_url, REDUCE_PROMPT, _aiter(groups), progress)
+    return "\n\n".join(summaries), True